@@ -0,0 +1,189 @@
+"""
+Benchmarks gmapi against benchmarks/stub_server.py.
+
+    python benchmarks/run.py
+    python benchmarks/run.py -scenario extract_all -items 5000 -workers 8 -latency_ms 20
+    python benchmarks/run.py -json results.json
+    python benchmarks/run.py -gzip                  (the stub gzips its responses)
+
+Scenarios (-scenario all runs every one):
+
+    extract_all    extract_all of every item into a temporary directory
+    bulk_fetch     get_gm_item for every item from -workers threads
+    search_decode  one search() of every item
+    cli_startup    `gm version` in a new interpreter, -runs times
+
+Each scenario runs in its own process so peak RSS is the scenario's alone, and
+reports items/sec, p50/p99 request latency (process latency for cli_startup)
+and peak RSS.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import resource
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+sys.path.insert(0, ROOT)
+from gmapi.cli import CLI
+
+SCENARIOS = ["extract_all", "bulk_fetch", "search_decode", "cli_startup"]
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return rss / (1024.0 * 1024.0)
+    return rss / 1024.0
+
+
+def timed_client(server_url, workers):
+    """
+    a GraymetaClient that records the latency of every request
+    """
+    from gmapi.gmapi import GraymetaClient
+    client = GraymetaClient(server_url, "bench-key", pool_maxsize=max(10, workers * 2))
+    latencies = []
+    client.add_request_hook(post=lambda method, endpoint, partial_url, response, seconds: latencies.append(seconds))
+    return client, latencies
+
+
+def run_extract_all(server_url, cli):
+    workers = int(cli.getOrDefault("-workers", "1"))
+    client, latencies = timed_client(server_url, workers)
+    output_dir = tempfile.mkdtemp(prefix="gmapi-bench-")
+    try:
+        args = ["gm", "extract_all", "-output_dir", output_dir, "-cache_file", os.path.join(output_dir, "cache.txt"), "-workers", str(workers)]
+        for key in ("-format", "-page_size"):
+            if cli.containsKey(key):
+                args.extend([key, cli.getOrDie(key)])
+        start = time.time()
+        client.extract_all(CLI(args))
+        elapsed = time.time() - start
+        items = len(open(os.path.join(output_dir, "cache.txt")).read().split())
+    finally:
+        shutil.rmtree(output_dir)
+    return items, elapsed, latencies
+
+
+def run_bulk_fetch(server_url, cli):
+    workers = int(cli.getOrDefault("-workers", "8"))
+    client, latencies = timed_client(server_url, workers)
+    ids = [entry["result"]["_id"] for entry in client.iter_search()]
+    latencies[:] = []
+    start = time.time()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        list(pool.map(client.get_gm_item, ids))
+    finally:
+        pool.shutdown(wait=True)
+    return len(ids), time.time() - start, latencies
+
+
+def run_search_decode(server_url, cli):
+    client, latencies = timed_client(server_url, 1)
+    start = time.time()
+    response = client.search()
+    return len(response["results"]), time.time() - start, latencies
+
+
+def run_cli_startup(server_url, cli):
+    runs = int(cli.getOrDefault("-runs", "20"))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    latencies = []
+    start = time.time()
+    for i in range(runs):
+        run_start = time.time()
+        # gm version exits 1, so only the time matters
+        subprocess.call([sys.executable, "-c", "import sys; from gmapi.code import main; sys.argv = ['gm', 'version']; main()"], env=env, stdout=subprocess.DEVNULL)
+        latencies.append(time.time() - run_start)
+    return runs, time.time() - start, latencies
+
+
+def run_child(cli):
+    """
+    runs one scenario in this process and prints its result as json
+    """
+    scenario = cli.getOrDie("-scenario")
+    server_url = cli.getOrDie("-server_url")
+    runner = globals()["run_" + scenario]
+    stdout = sys.stdout
+    # keep the client's progress output out of the result
+    sys.stdout = open(os.devnull, "w")
+    try:
+        items, elapsed, latencies = runner(server_url, cli)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    result = {
+        "scenario": scenario,
+        "items": items,
+        "seconds": elapsed,
+        "items_per_sec": items / elapsed if elapsed > 0 else 0.0,
+        "requests": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    print(json.dumps(result))
+
+
+def start_stub(cli):
+    args = [sys.executable, os.path.join(HERE, "stub_server.py")]
+    for key, default in (("-items", "2000"), ("-latency_ms", "5"), ("-latency_jitter_ms", "0"), ("-payload_kb", "16"), ("-error_rate", "0"), ("-seed", "1")):
+        args.extend([key, cli.getOrDefault(key, default)])
+    if cli.containsKey("-gzip"):
+        args.append("-gzip")
+    stub = subprocess.Popen(args, stdout=subprocess.PIPE)
+    line = stub.stdout.readline().decode("utf-8")
+    port = line.strip().split(" ")[-1]
+    return stub, "http://127.0.0.1:" + port
+
+
+def main():
+    cli = CLI(sys.argv)
+    if cli.containsKey("-child"):
+        run_child(cli)
+        return
+
+    scenario = cli.getOrDefault("-scenario", "all")
+    scenarios = SCENARIOS if scenario == "all" else scenario.split(",")
+
+    stub, server_url = start_stub(cli)
+    results = []
+    try:
+        print("scenario".ljust(16) + "items".rjust(8) + "items/s".rjust(12) + "p50 ms".rjust(10) + "p99 ms".rjust(10) + "rss MB".rjust(10))
+        for name in scenarios:
+            args = [sys.executable, os.path.abspath(__file__), "-child", "-scenario", name, "-server_url", server_url]
+            for key in ("-workers", "-format", "-page_size", "-runs"):
+                if cli.containsKey(key):
+                    args.extend([key, cli.getOrDie(key)])
+            output = subprocess.check_output(args).decode("utf-8")
+            result = json.loads(output.strip().split("\n")[-1])
+            results.append(result)
+            print(name.ljust(16) + str(result["items"]).rjust(8) + ("%.1f" % result["items_per_sec"]).rjust(12) + ("%.2f" % result["p50_ms"]).rjust(10) + ("%.2f" % result["p99_ms"]).rjust(10) + ("%.1f" % result["peak_rss_mb"]).rjust(10))
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    if cli.containsKey("-json"):
+        open(cli.getOrDie("-json"), "w").write(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+A local stand-in for a GrayMeta server, serving the endpoints GraymetaClient uses
+with generated data, so gmapi can be benchmarked without a real installation.
+
+    python benchmarks/stub_server.py -port 8080 -items 10000 -latency_ms 20 -payload_kb 64 -error_rate 0.01 -gzip
+
+prints "listening on {port}" once it is ready (-port 0 picks a free port).
+Responses are generated from -seed so runs are reproducible.  With -gzip responses
+are gzipped for clients that accept it; gzipped request bodies are always accepted.
+"""
+import os
+import sys
+import json
+import gzip
+import time
+import random
+import hashlib
+import threading
+
+try:
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    print("stub_server needs python 3.7+")
+    sys.exit(1)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gmapi.cli import CLI
+
+
+class StubConfig():
+
+    def __init__(self, items=1000, latency_ms=0, latency_jitter_ms=0, payload_kb=16, error_rate=0.0, seed=1, gzip=False):
+        self.items = items
+        self.gzip = gzip
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.payload_kb = payload_kb
+        self.error_rate = error_rate
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.harvests = 0
+
+    def item_id(self, n):
+        return hashlib.md5((str(self.seed) + ":" + str(n)).encode("utf-8")).hexdigest()
+
+    def search_result(self, n):
+        gm_item_id = self.item_id(n)
+        return { "result": {
+            "_id": gm_item_id,
+            "stow_url": "s3://https://bench-bucket/executions/" + str(n % 97) + "/" + str(n % 13) + "/file" + str(n) + ".mp4",
+            "name": "file" + str(n) + ".mp4",
+            "stow_container_id": "bench-bucket",
+            "last_modified": "2020-01-%02dT00:00:00Z" % (n % 28 + 1),
+            "last_harvested": "2020-02-%02dT00:00:00Z" % (n % 28 + 1),
+        } }
+
+    def document(self, gm_item_id, version):
+        # repeatable filler of roughly payload_kb
+        words = ["graymeta", "keyword", "face", "transcript", "object", "label", "scene", gm_item_id[:8]]
+        rnd = random.Random(gm_item_id + version)
+        size = self.payload_kb * 1024
+        segments = []
+        length = 0
+        while length < size:
+            segment = { "start": length, "text": " ".join(rnd.choice(words) for i in range(12)), "confidence": rnd.random() }
+            segments.append(segment)
+            length += 120
+        return { "id": gm_item_id, "version": version, "keywords": words, "segments": segments }
+
+    def should_fail(self):
+        with self.lock:
+            return self.error_rate > 0 and self.random.random() < self.error_rate
+
+    def delay(self):
+        if self.latency_ms or self.latency_jitter_ms:
+            with self.lock:
+                jitter = self.random.uniform(0, self.latency_jitter_ms)
+            time.sleep((self.latency_ms + jitter) / 1000.0)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        compress = self.config.gzip and "gzip" in (self.headers.get("Accept-Encoding") or "")
+        if compress:
+            body = gzip.compress(body, 6)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if compress:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length == 0:
+            return {}
+        body = self.rfile.read(length)
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        try:
+            return json.loads(body.decode("utf-8"))
+        except ValueError:
+            return {}
+
+    def handle_request(self, method):
+        config = self.config
+        data = self.read_json() if method in ("POST", "DELETE") else {}
+        config.delay()
+        if config.should_fail():
+            return self.send_json({ "error": "stub overloaded" }, 503)
+
+        path = self.path.split("?")[0]
+        parts = path.strip("/").split("/")
+
+        if method == "POST" and path == "/api/data/search":
+            offset = data.get("offset") or 0
+            limit = data.get("limit") or 50000
+            end = min(config.items, offset + limit)
+            if data.get("query"):
+                # a stand in for the server's text search
+                matching = [n for n in range(config.items) if data["query"] in config.search_result(n)["result"]["stow_url"]]
+                results = [config.search_result(n) for n in matching[offset:offset + limit]]
+            else:
+                results = [config.search_result(n) for n in range(offset, end)]
+            if data.get("only"):
+                for entry in results:
+                    entry["result"] = dict((k, v) for k, v in entry["result"].items() if k == "_id" or k in data["only"])
+            return self.send_json({ "total": config.items, "results": results })
+        if method == "GET" and path.startswith("/api/data/items/") and len(parts) == 4:
+            return self.send_json(config.document(parts[3], "v1"))
+        if method == "GET" and path.startswith("/files/") and path.endswith("/metadata2.json"):
+            return self.send_json(config.document(parts[1], "v2"))
+        if method == "GET" and path == "/api/control/system/stats":
+            with config.lock:
+                pending = config.harvests
+                config.harvests = max(0, config.harvests - 5)
+            return self.send_json({ "queue_depths": { "walk": 0, "stage00": pending, "index": 0 }, "jobs": { "running": min(pending, 10), "pending": max(0, pending - 10) } })
+        if method == "POST" and path == "/api/control/harvest":
+            with config.lock:
+                config.harvests += 1
+            return self.send_json({ "status": "ok" })
+        if method == "POST" and path == "/api/control/item-id":
+            return self.send_json({ "gm_item_id": hashlib.md5(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest() })
+        if method == "GET" and path == "/api/data/locations":
+            return self.send_json({ "locations": [ { "id": "bench-location" } ] })
+        if method == "GET" and path == "/api/data/containers/enabled":
+            return self.send_json([ { "id": "bench-bucket" } ])
+        if path.startswith("/api/data/comments"):
+            if method == "GET":
+                return self.send_json({ "comments": [] })
+            return self.send_json({ "id": "comment-1" })
+        if path.startswith("/api/data/keyword"):
+            if method == "GET":
+                return self.send_json({ "groups": [] })
+            return self.send_json({ "id": "group-1" })
+        if method == "GET" and path in ("/api/data/healthz", "/api/data/features", "/api/data/user"):
+            return self.send_json({ "status": "ok" })
+        return self.send_json({ "error": "not found" }, 404)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+
+def create_server(config, port=0):
+    handler = type("ConfiguredStubHandler", (StubHandler,), { "config": config })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    cli = CLI(sys.argv)
+    config = StubConfig(items=int(cli.getOrDefault("-items", "1000")),
+        latency_ms=float(cli.getOrDefault("-latency_ms", "0")),
+        latency_jitter_ms=float(cli.getOrDefault("-latency_jitter_ms", "0")),
+        payload_kb=int(cli.getOrDefault("-payload_kb", "16")),
+        error_rate=float(cli.getOrDefault("-error_rate", "0")),
+        seed=int(cli.getOrDefault("-seed", "1")),
+        gzip=cli.containsKey("-gzip"))
+    server = create_server(config, int(cli.getOrDefault("-port", "0")))
+    print("listening on " + str(server.server_address[1]))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+asyncio flavour of GraymetaClient, needs aiohttp (pip install gmapi[async])
+
+    async with AsyncGraymetaClient(SERVER_URL, API_KEY, concurrency=500) as client:
+        items = await asyncio.gather(*[client.get_gm_item(i) for i in ids])
+"""
+import asyncio
+from . import jsoncodec
+from .query import SearchQuery
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncGraymetaClient():
+
+    def __init__(self, server_url, api_key, concurrency=100, limit_per_host=0, keep_alive=True, timeout=None, ssl_verify=True):
+        """
+        All coroutines share one aiohttp session (created on first use) and at
+        most `concurrency` requests are in flight at once.  limit_per_host=0 means
+        the connection pool is only bounded by `concurrency`.
+        """
+        if aiohttp is None:
+            raise ImportError("AsyncGraymetaClient requires aiohttp, pip install gmapi[async]")
+        self.SERVER_URL = server_url
+        self.API_KEY = api_key
+        self.HEADERS = { "Authorization": "Bearer " + self.API_KEY }
+        self.SSL_VERIFY = ssl_verify
+        self.TIMEOUT = timeout
+        self.concurrency = concurrency
+        self.limit_per_host = limit_per_host
+        self.keep_alive = keep_alive
+        self.session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _get_session(self):
+        # the session and semaphore must be created inside the running loop
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.limit_per_host, ssl=None if self.SSL_VERIFY else False, force_close=not self.keep_alive)
+            timeout = aiohttp.ClientTimeout(total=self.TIMEOUT)
+            self.session = aiohttp.ClientSession(connector=connector, headers=self.HEADERS, timeout=timeout)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self.session
+
+    async def _request(self, method, partial_url, **kwargs):
+        """
+        returns (status, decoded json or None)
+        """
+        session = self._get_session()
+        async with self._semaphore:
+            async with session.request(method, self.SERVER_URL + partial_url, **kwargs) as r:
+                body = await r.read()
+                try:
+                    data = jsoncodec.loads(body) if body else None
+                except ValueError:
+                    data = None
+                return r.status, data
+
+    async def http_get(self, partial_url):
+        status, data = await self._request("GET", partial_url)
+        if status >= 200 and status < 300:
+            return data
+        else:
+            return None
+
+    async def http_post(self, partial_url, data):
+        status, response = await self._request("POST", partial_url, data=jsoncodec.dumps_bytes(data))
+        return response
+
+    async def http_delete(self, partial_url, data=None):
+        if data:
+            data_str = jsoncodec.dumps_bytes(data)
+        else:
+            data_str = ""
+        status, response = await self._request("DELETE", partial_url, data=data_str)
+        return response
+
+    async def summary_platform(self):
+        return await self.http_get("/api/data/summary/platform")
+
+    async def summary_data(self):
+        return await self.http_get("/api/data/summary/data")
+
+    async def features(self):
+        return await self.http_get("/api/data/features")
+
+    async def add_comment(self, gm_item_id, comment):
+        data = { "target_type": "item", "target_id": gm_item_id, "body": comment }
+        return await self.http_post("/api/data/comments", data)
+
+    async def list_comments(self, gm_item_id):
+        return await self.http_get("/api/data/comments?target_type=item&page=0&target_id=" + gm_item_id)
+
+    async def delete_comment(self, gm_item_id, comment_id):
+        return await self.http_delete("/api/data/comments/" + comment_id)
+
+    async def harvest_item(self, location_id, container_id, stow_url, gm_item_id, force, extractors, override_extractors, new_extractors):
+        data = { "location_id": location_id, "container_id": container_id, "item_stow_url": stow_url, "force": force, "extractors": extractors, "override_extractors": override_extractors, "new_extractors": new_extractors }
+        return await self.http_post("/api/control/harvest", data)
+
+    async def harvest_container(self, location_id, container_id, force=False):
+        data = { "location_id": location_id, "container_id": container_id, "force": force}
+        return await self.http_post("/api/control/harvest", data)
+
+    async def get_gm_item_id(self, location_id, container_id, item_id):
+        data = { "location_id": location_id, "container_id": container_id, "item_id": item_id }
+        status, response = await self._request("POST", "/api/control/item-id", data=jsoncodec.dumps_bytes(data))
+        if status >= 200 and status <= 299:
+            return response
+        else:
+            return None
+
+    async def get_gm_item(self, gm_item_id):
+        return await self.http_get("/api/data/items/" + gm_item_id)
+
+    async def get_gm_item_v2(self, gm_item_id):
+        return await self.http_get("/files/" + gm_item_id + "/metadata2.json")
+
+    async def delete_gm_item(self, gm_item_id):
+        return await self.http_delete("/api/data/items/" + gm_item_id)
+
+    async def upload_captions(self, gm_item_id, stl_filename):
+        with open(stl_filename, 'rb') as f:
+            form = aiohttp.FormData()
+            form.add_field("caption_file", f.read(), filename=stl_filename.split("/")[-1])
+        status, response = await self._request("POST", "/api/data/items/" + gm_item_id + "/captions", data=form)
+        return response
+
+    async def get_captions(self, gm_item_id):
+        return await self.http_get("/api/data/items/" + gm_item_id + "?only=captions.captions")
+
+    async def delete_captions(self, gm_item_id, captions_id):
+        return await self.http_delete("/api/data/items/" + gm_item_id + "/captions?caption_id=" + captions_id)
+
+    async def list_location(self, location_id):
+        return await self.http_get("/api/data/locations/" + location_id)
+
+    async def list_locations(self):
+        return await self.http_get("/api/data/locations")
+
+    async def list_containers(self, location_id):
+        return await self.http_get("/api/data/locations/" + location_id + "/containers")
+
+    async def list_enabled_containers(self):
+        return await self.http_get("/api/data/containers/enabled")
+
+    async def health(self):
+        return await self.http_get("/api/data/healthz")
+
+    async def isIdle(self):
+        stats = await self.stats()
+        running_jobs = stats.get("jobs").get("running") or 0
+        pending_jobs = stats.get("jobs").get("pending") or 0
+        return (running_jobs + pending_jobs) == 0
+
+    async def stats(self):
+        return await self.http_get("/api/control/system/stats")
+
+    async def activity(self):
+        return await self.http_get("/api/data/activity")
+
+    async def user(self):
+        return await self.http_get("/api/data/user")
+
+    async def platform(self):
+        return await self.http_get("/api/data/summary/platform")
+
+    async def scroll(self):
+        return await self.http_post("/api/data/scroll", {})
+
+    async def search_query(self, query):
+        return await self.http_post("/api/data/search", query.to_dict())
+
+    async def search(self, limit=50000):
+        return await self.search_query(SearchQuery(limit))
+
+    async def search_quick(self, limit=50000):
+        return await self.search_query(SearchQuery(limit).only("gm_item_id"))
+
+    async def search_extracted(self, limit=50000):
+        return await self.search_query(SearchQuery(limit).exists("extracted"))
+
+    async def search_not_extracted(self, limit=50000):
+        return await self.search_query(SearchQuery(limit).not_exists("extracted"))
+
+    async def search_last_modified(self, date_from, date_to, limit=1000):
+        return await self.search_query(SearchQuery(limit).last_modified(date_from, date_to))
+
+    async def search_last_harvested(self, date_from, date_to, limit=1000):
+        return await self.search_query(SearchQuery(limit).last_harvested(date_from, date_to))
+
+    async def compilations(self):
+        return await self.http_get("/api/data/summary/compilations")
+
+    async def keyword_list_groups(self):
+        return await self.http_get("/api/data/keywords")
+
+    async def keyword_get_group(self, group_id):
+        return await self.http_get("/api/data/keyword-groups/" + group_id)
+
+    async def keyword_create_group(self, name, color):
+        data = {"name": name, "color": color }
+        return await self.http_post("/api/data/keyword-groups", data)
+
+    async def keyword_delete_group(self, group_id):
+        return await self.http_delete("/api/data/keyword-groups/" + group_id)
+
+    async def keyword_add_to_group(self, group_id, word):
+        data = {"word": word}
+        return await self.http_post("/api/data/keywords/" + group_id, data)
+
+    async def keyword_remove_from_group(self, group_id, word):
+        return await self.http_delete("/api/data/keywords/" + group_id + "?word=" + word)
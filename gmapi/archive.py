@@ -0,0 +1,155 @@
+"""
+A compact alternative to extract's three json files per item.
+
+Items are written as JSON Lines records, { "_id", "v1", "v2", "index" }, into
+compressed shards of about shard_size bytes:
+
+    output_dir/shard-00000.jsonl.gz
+    output_dir/shard-00001.jsonl.gz
+    output_dir/index.jsonl
+
+Each record is compressed on its own (a gzip member or zstd frame) so a shard is
+still a normal file for zcat/zstdcat, and index.jsonl records the shard, offset
+and length of every record so one item can be read without the rest of its shard.
+"""
+import os
+import gzip
+import json
+import threading
+from . import jsoncodec
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+INDEX_FILENAME = "index.jsonl"
+EXTENSIONS = { "gzip": ".jsonl.gz", "zstd": ".jsonl.zst" }
+
+def default_compression():
+    if zstandard is not None:
+        return "zstd"
+    return "gzip"
+
+def _compress(compression, data):
+    if compression == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data)
+
+def _decompress(compression, data):
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+def _compression_of(shard):
+    if shard.endswith(EXTENSIONS["zstd"]):
+        return "zstd"
+    return "gzip"
+
+
+class ArchiveWriter():
+
+    def __init__(self, output_dir, shard_size=256 * 1024 * 1024, compression=None):
+        self.output_dir = output_dir
+        self.shard_size = shard_size
+        self.compression = compression or default_compression()
+        if self.compression == "zstd" and zstandard is None:
+            raise ImportError("zstd compression requires zstandard, pip install zstandard")
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        # carry on after the shards of any previous run
+        self._shard_number = len([f for f in os.listdir(output_dir) if f.startswith("shard-")])
+        self._shard = None
+        self._shard_name = None
+        self._index = open(os.path.join(output_dir, INDEX_FILENAME), "a")
+        self._lock = threading.Lock()
+
+    def _rotate(self):
+        if self._shard is not None:
+            self._shard.close()
+        self._shard_name = "shard-" + str(self._shard_number).zfill(5) + EXTENSIONS[self.compression]
+        self._shard_number += 1
+        self._shard = open(os.path.join(self.output_dir, self._shard_name), "ab")
+
+    def write(self, gm_item_id, gm_item, gm_item_v2, result):
+        record = { "_id": gm_item_id, "v1": gm_item, "v2": gm_item_v2, "index": result }
+        self.write_record(gm_item_id, jsoncodec.dumps_bytes(record) + b"\n")
+
+    def write_raw(self, gm_item_id, raw_v1, raw_v2, raw_index):
+        """
+        raw_v1, raw_v2 and raw_index are already encoded json, e.g. as the server sent them
+        """
+        # json strings can't hold a raw newline, so any are whitespace and safe to flatten
+        record = b'{"_id":' + jsoncodec.dumps_bytes(gm_item_id) + b',"v1":' + raw_v1.replace(b"\n", b" ").replace(b"\r", b" ") + b',"v2":' + raw_v2.replace(b"\n", b" ").replace(b"\r", b" ") + b',"index":' + raw_index + b'}\n'
+        self.write_record(gm_item_id, record)
+
+    def write_record(self, gm_item_id, record):
+        """
+        record is one already encoded json line
+        """
+        compressed = _compress(self.compression, record)
+        with self._lock:
+            if self._shard is None or (self._shard.tell() > 0 and self._shard.tell() + len(compressed) > self.shard_size):
+                self._rotate()
+            offset = self._shard.tell()
+            self._shard.write(compressed)
+            self._shard.flush()
+            # the index is only written once the record is in its shard
+            entry = { "_id": gm_item_id, "shard": self._shard_name, "offset": offset, "length": len(compressed) }
+            self._index.write(json.dumps(entry) + "\n")
+            self._index.flush()
+
+    def close(self):
+        with self._lock:
+            if self._shard is not None:
+                self._shard.close()
+                self._shard = None
+            self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ArchiveReader():
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        self.index = {}
+        with open(os.path.join(archive_dir, INDEX_FILENAME), "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                # the last write of an item wins
+                entry = json.loads(line)
+                self.index[entry["_id"]] = entry
+
+    def __contains__(self, gm_item_id):
+        return gm_item_id in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def read_raw(self, gm_item_id):
+        entry = self.index.get(gm_item_id)
+        if entry is None:
+            return None
+        with open(os.path.join(self.archive_dir, entry["shard"]), "rb") as f:
+            f.seek(entry["offset"])
+            return _decompress(_compression_of(entry["shard"]), f.read(entry["length"]))
+
+    def read(self, gm_item_id):
+        """
+        the { "_id", "v1", "v2", "index" } record for an item, or None
+        """
+        raw = self.read_raw(gm_item_id)
+        if raw is None:
+            return None
+        return jsoncodec.loads(raw)
+
+    def __iter__(self):
+        for gm_item_id in self.index:
+            yield self.read(gm_item_id)
@@ -0,0 +1,84 @@
+import os
+import json
+import threading
+
+class CheckpointStore():
+    """
+    The set of ids already processed, e.g. extract_all's -cache_file.
+
+    Stored as an append-only file with one id per line so adding an id is a
+    single small write and a lookup is a set membership check.  A file in the
+    old format (one JSON list) is converted when it is opened.
+    """
+
+    def __init__(self, filename, sync=True):
+        """
+        sync=True fsyncs after every add so an id is never lost in a crash
+        """
+        self.filename = filename
+        self.sync = sync
+        self.ids = set()
+        self._lock = threading.Lock()
+        self._load()
+        self._file = open(self.filename, "a")
+
+    def _load(self):
+        if not os.path.isfile(self.filename):
+            return
+
+        with open(self.filename, "r") as f:
+            content = f.read()
+
+        if content.lstrip().startswith("["):
+            # the old json list format, rewrite it as a log
+            self.ids = set(json.loads(content))
+            self._rewrite()
+            return
+
+        if content and not content.endswith("\n"):
+            # a torn write from a crash, drop the partial last line
+            content = content[:content.rfind("\n") + 1]
+            with open(self.filename, "r+") as f:
+                f.truncate(len(content.encode("utf-8")))
+
+        for line in content.split("\n"):
+            line = line.strip()
+            if line:
+                self.ids.add(line)
+
+    def _rewrite(self):
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            for gm_item_id in self.ids:
+                f.write(gm_item_id + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_filename, self.filename)
+
+    def add(self, gm_item_id):
+        with self._lock:
+            if gm_item_id in self.ids:
+                return
+            self._file.write(gm_item_id + "\n")
+            self._file.flush()
+            if self.sync:
+                os.fsync(self._file.fileno())
+            self.ids.add(gm_item_id)
+
+    def __contains__(self, gm_item_id):
+        return gm_item_id in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
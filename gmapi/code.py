@@ -1,13 +1,71 @@
 import sys
 import os
-import json
 
 # py2/3 imports fix
-from .gmapi import GraymetaClient
 from .cli import CLI
 from .constants import *
 
+# only the command being run imports what it needs (the client pulls in requests),
+# so `gm` and `gm version` start quickly
+
 COMMAND="gm"
+LJUST = 60
+
+class Command():
+    """
+    a gm subcommand: handler(gm, cli, *args) is called with a GraymetaClient (None
+    when server is False) and the values of its positional args
+    """
+
+    def __init__(self, name, handler, args=(), flags="", help=None, options=(), group=None, server=True):
+        self.name = name
+        self.handler = handler
+        self.args = args
+        self.flags = flags
+        self.help = help
+        self.options = options
+        self.group = group
+        self.server = server
+
+    def usage(self):
+        parts = [self.name] + ["{" + arg + "}" for arg in self.args]
+        if self.flags:
+            parts.append(self.flags)
+        return " ".join(parts)
+
+# name -> Command, in the order they are listed in the usage
+COMMANDS = {}
+
+def command(name, args=(), flags="", help=None, options=(), group=None, server=True):
+    """
+    registers the decorated function as a command, help=None leaves it out of the usage
+    """
+    def register(handler):
+        COMMANDS[name] = Command(name, handler, args, flags, help, options, group, server)
+        return handler
+    return register
+
+# (usage, help) for the options every server command takes
+GLOBAL_OPTIONS = [
+    ("-nossl", "do not verify the server's SSL certificate"),
+    ("-timeout {seconds}", "timeout for each HTTP request (default none)"),
+    ("-pool_size {n}", "connections kept alive to the server (default 10)"),
+    ("-max_retries {n}", "retries for reads that get 429/502/503/504 or time out (default 5)"),
+    ("-latency_target_ms {ms}", "fewer requests at once while responses are slower than this"),
+    ("-no_compression", "ask for uncompressed responses"),
+    ("-compress_requests", "gzip request bodies of 1KB or more (the server must accept them)"),
+    ("-metadata_cache_file {file}", "reuse location/container lookups between runs"),
+    ("-metadata_cache_ttl {seconds}", "how long they are reused for (default 300)"),
+    ("-metrics_file {file}", "writes request metrics on exit (.prom for Prometheus text, else json)"),
+    ("-metrics_port {port}", "serves request metrics at http://localhost:{port}/metrics"),
+    ("-metrics_host {host}", "address to serve them on (default 127.0.0.1, 0.0.0.0 for every interface)"),
+    ("-v", "verbose HTTP logging"),
+]
+
+def usageLine(usage, help):
+    if help:
+        return usage.ljust(LJUST) + "- " + help
+    return usage
 
 def usageAndDie():
     print("gm is a tool for querying a graymeta.com installation over https")
@@ -19,64 +77,34 @@ def usageAndDie():
     print("")
     server_url = os.environ.get("GRAYMETA_SERVER_URL") or None
     server_key = os.environ.get("GRAYMETA_API_KEY") or None
-    ljust_value = 60
 
     if server_url:
-        print("    GRAYMETA_SERVER_URL".ljust(ljust_value) + ": " + server_url)
+        print("    GRAYMETA_SERVER_URL".ljust(LJUST) + ": " + server_url)
     else:
-        print("    GRAYMETA_SERVER_URL".ljust(ljust_value) + ": unset - please `export GRAYMETA_SERVER_URL=https://your-graymeta-server`")
+        print("    GRAYMETA_SERVER_URL".ljust(LJUST) + ": unset - please `export GRAYMETA_SERVER_URL=https://your-graymeta-server`")
 
     if server_key:
-        print("    GRAYMETA_API_KEY".ljust(ljust_value) + ": xxxxxxxx")
+        print("    GRAYMETA_API_KEY".ljust(LJUST) + ": xxxxxxxx")
     else:
-        print("    GRAYMETA_API_KEY".ljust(ljust_value) + ": unset - please `export GRAYMETA_API_KEY=xxxxxxx`")
+        print("    GRAYMETA_API_KEY".ljust(LJUST) + ": unset - please `export GRAYMETA_API_KEY=xxxxxxx`")
 
     print("")
     print("The commands are:")
+    group = None
+    for cmd in COMMANDS.values():
+        if cmd.help is None:
+            continue
+        if cmd.group is None or cmd.group != group:
+            print("")
+        group = cmd.group
+        print(usageLine("    " + cmd.usage(), cmd.help))
+        for usage, help in cmd.options:
+            print(usageLine("           " + usage, help))
     print("")
-    print("    list_locations".ljust(ljust_value) + "- displays all locations")
-    print("    list_location {location_id}".ljust(ljust_value) + "- gets information on a specific location")
-    print("")
-    print("    list_containers {location_id}".ljust(ljust_value) + "- displays enabled containers")
-    print("    list_all_containers {location_id}".ljust(ljust_value) + "- displays all containers")
-    print("")
-    print("    search -json".ljust(ljust_value) + "- displays all items (-json prints json)")
-    print("           -last_modified_from|-last_modified_to")
-    print("           -last_harvested_from|-last_harvested_to")
-    print("")
-    print("    get_gm_item_id {location_id} {container_id} {item_id}".ljust(ljust_value) + "- gets the gm_item_id for ")
-    print("    get_gm_item {gm_item_id}".ljust(ljust_value) + "- gets metadata for an item using the gm_item_id")
-    print("    get_gm_item_v2 {gm_item_id}".ljust(ljust_value) + "- gets metadata v2 for an item using the gm_item_id")
-    print("")
-    print("    create_gm_item_id_from_s3_key {s3_key}".ljust(ljust_value) + "- create gm_item_id from an s3_key")
-    print("    get_gm_item_id_from_s3_key {s3_key}".ljust(ljust_value) + "- gets gm_item_id from an s3_key")
-    print("    get_gm_item_from_s3_key {s3_key}".ljust(ljust_value) + "- gets metadata for an item using the s3_key")
-    print("")
-    print("    delete_gm_item {gm_item_id}".ljust(ljust_value) + "- deletes the metadata from graymeta")
-    print("")
-    print("    get_captions {gm_item_id}".ljust(ljust_value) + "- returns the captions in json")
-    print("    upload_captions {gm_item_id} {stl_filename} ".ljust(ljust_value) + "- uploads and associates an STL file with content")
-    print("    delete_captions {gm_item_id} {captions_id}".ljust(ljust_value) + "- deletes the captions from the item")
-    print("    upload_captions_content {gm_item_id} {stl_filename} ".ljust(ljust_value) + "- uploads and associates an STL file with content")
-    print("")
-    print("    harvest_item_from_s3_key {s3_key} {extractors,,}".ljust(ljust_value) + "- forces a harvest for an item via its S3 key")
-    print("    harvest_container {location_id} {container_id}".ljust(ljust_value) + "- forces a harvest for an entire container.")
-    print("    harvest_item {gm_item_id} {extractors,,}".ljust(ljust_value) + "- forces a harvest for an item via its gm_item_id")
-    print("")
-    print("    comment".ljust(ljust_value) + "- uses the Graymeta Comments API")
+    print("Options for every command:")
     print("")
-    print("    keyword".ljust(ljust_value) + "- uses the Graymeta Keywords API")
-    print("")
-    print("    extract_all".ljust(ljust_value) + "- extracts all metadata")
-    print("    extract (-q term)".ljust(ljust_value) + "- extracts all metadata where 'term' is present in the stow_url")
-    print("")
-    print("    stats".ljust(ljust_value) + "- print current /api/control/system/stats data.")
-    print("    health".ljust(ljust_value) + "- print current /api/data/healthz data.")
-    print("    activity".ljust(ljust_value) + "- print current /api/data/activity data.")
-    print("    version".ljust(ljust_value) + "- print current gmapi version number.")
-    print("    summary_platform".ljust(ljust_value) + "- print summary information about the platform.")
-    print("    summary_data".ljust(ljust_value) + "- print summary information about the data.")
-    print("    get {URL}".ljust(ljust_value) + "- returns response from a GET.")
+    for usage, help in GLOBAL_OPTIONS:
+        print(usageLine("    " + usage, help))
     print("")
 
     sys.exit(0)
@@ -89,12 +117,30 @@ def main():
     if len(sys.argv) == 1:
         usageAndDie()
 
-    command = sys.argv[1]
-    if command == "version":
+    name = sys.argv[1]
+    if name == "version":
         version()
         sys.exit(1)
 
+    cmd = COMMANDS.get(name)
+    if cmd is None:
+        print("I don't know how to '" + name + "'")
+        sys.exit(1)
+
+    if len(sys.argv) < 2 + len(cmd.args):
+        print("Usage: " + COMMAND + " " + cmd.usage())
+        sys.exit(1)
+
     cli = CLI(sys.argv)
+    gm = None
+    if cmd.server:
+        gm = client(cli)
+    cmd.handler(gm, cli, *sys.argv[2:2 + len(cmd.args)])
+
+def client(cli):
+    """
+    a GraymetaClient for GRAYMETA_SERVER_URL set up from the options every command takes
+    """
     server_url = os.environ.get("GRAYMETA_SERVER_URL") or None
     server_key = os.environ.get("GRAYMETA_API_KEY") or None
 
@@ -106,239 +152,451 @@ def main():
         print("Error, GRAYMETA_API_KEY is required.")
         sys.exit(1)
 
-    gm = GraymetaClient(server_url, server_key)
+    from .gmapi import GraymetaClient
+
+    # enough connections for every worker, extract uses two per item
+    workers = int(cli.getOrDefault("-workers", "1"))
+    pool_size = int(cli.getOrDefault("-pool_size", str(max(10, workers * 2))))
+    timeout = cli.getOrDefault("-timeout", None)
+    if timeout is not None:
+        timeout = float(timeout)
+
+    metadata_cache_ttl = int(cli.getOrDefault("-metadata_cache_ttl", "300"))
+    metadata_cache_file = cli.getOrDefault("-metadata_cache_file", None)
+
+    max_retries = int(cli.getOrDefault("-max_retries", "5"))
+    latency_target = cli.getOrDefault("-latency_target_ms", None)
+    if latency_target is not None:
+        latency_target = float(latency_target) / 1000
+
+    gm = GraymetaClient(server_url, server_key, pool_maxsize=pool_size, timeout=timeout, metadata_cache_ttl=metadata_cache_ttl, metadata_cache_file=metadata_cache_file, max_retries=max_retries, latency_target=latency_target, compress_responses=not cli.containsKey("-no_compression"), compress_requests=cli.containsKey("-compress_requests"))
     if cli.containsKey("-nossl"):
         gm.SSL_VERIFY = False
 
     if cli.containsKey("-v") or cli.containsKey("--verbose") or cli.containsKey("-verbose"):
         gm.verbose = True
 
-    if command == "upload_captions":
-        gm_item_id = sys.argv[2]
-        stl_filename = sys.argv[3]
-        nicePrint(gm.upload_captions(gm_item_id, stl_filename))
+    if cli.containsKey("-metrics_port"):
+        gm.metrics.serve(int(cli.getOrDie("-metrics_port")), cli.getOrDefault("-metrics_host", "127.0.0.1"))
+
+    if cli.containsKey("-metrics_file"):
+        # written however the command finishes
+        import atexit
+        atexit.register(gm.metrics.write, cli.getOrDie("-metrics_file"))
+
+    return gm
+
+@command("list_locations", help="displays all locations", group="locations")
+def list_locations(gm, cli):
+    nicePrint(gm.list_locations())
+
+@command("list_location", ["location_id"], help="gets information on a specific location", group="locations")
+def list_location(gm, cli, location_id):
+    nicePrint(gm.list_location(location_id))
+
+@command("list_containers", help="displays enabled containers", group="containers")
+def list_containers(gm, cli):
+    nicePrint(gm.list_enabled_containers())
+
+@command("list_all_containers", ["location_id"], help="displays all containers", group="containers")
+def list_all_containers(gm, cli, location_id):
+    nicePrint(gm.list_containers(location_id))
+
+def commaList(value):
+    if not value:
+        return []
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+@command("search", flags="-json", help="displays all items (-json prints json)", group="search", options=[
+    ("-format jsonl|csv|tsv|table", "streams results as they arrive (-jsonl is -format jsonl)"),
+    ("-fields {f1,f2}", "fields of each result to print, may be dotted paths"),
+    ("-only {f1,f2}", "fields the server returns (default: those in -fields)"),
+    ("-extracted | -not_extracted", "only items that have or have not been extracted"),
+    ("-last_modified_from|-last_modified_to", None),
+    ("-last_harvested_from|-last_harvested_to", None),
+    ("-limit {n}", "at most n results"),
+    ("-page_size {n}", "results fetched per request (default 1000)")])
+def search(gm, cli):
+    from .query import SearchQuery
+    query = SearchQuery()
+    date_range = False
+    if cli.containsKey("-last_modified_from") or cli.containsKey("-last_modified_to"):
+        query.last_modified(cli.getOrDie("-last_modified_from"), cli.getOrDie("-last_modified_to"))
+        date_range = True
+    if cli.containsKey("-last_harvested_from") or cli.containsKey("-last_harvested_to"):
+        query.last_harvested(cli.getOrDie("-last_harvested_from"), cli.getOrDie("-last_harvested_to"))
+        date_range = True
+    if cli.containsKey("-extracted"):
+        query.exists("extracted")
+    if cli.containsKey("-not_extracted"):
+        query.not_exists("extracted")
+    if cli.containsKey("-limit"):
+        query.limit(int(cli.getOrDie("-limit")))
+
+    fields = commaList(cli.getOrDefault("-fields", None))
+    only = commaList(cli.getOrDefault("-only", None))
+    if not only and fields:
+        # nothing but the fields being printed needs to be sent
+        only = ["_id"] + [field.split(".")[0] for field in fields]
+    query.only(*only)
+
+    if cli.containsKey("-json"):
+        if not cli.containsKey("-limit"):
+            query.limit(1000 if date_range else 50000)
+        nicePrint(gm.search_query(query))
+        return
+
+    from .formats import FORMATS, write_results
+    if cli.containsKey("-jsonl"):
+        format = "jsonl"
+    else:
+        format = cli.getOrDefault("-format", "table")
+    if format not in FORMATS:
+        print("Error, -format must be one of " + ", ".join(FORMATS))
+        sys.exit(1)
+    if format == "table" and only and not fields:
+        # the default table needs fields the projection may have left out
+        fields = only
+
+    # jsonl without -fields or -only can be read back by extract/extract_all with -search_file
+    page_size = int(cli.getOrDefault("-page_size", "1000"))
+    try:
+        count = write_results(gm.iter_search(query, page_size), format, fields)
+    except BrokenPipeError:
+        # the reader (head, ...) has all it wants, don't complain flushing stdout on exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(0)
+    if count == 0 and format == "table":
+        print("No results found.")
+
+@command("get_gm_item_id", ["location_id", "container_id", "item_id"], help="gets the gm_item_id for ", group="items")
+def get_gm_item_id(gm, cli, location_id, container_id, item_id):
+    nicePrint(gm.get_gm_item_id(location_id, container_id, item_id))
+
+@command("get_gm_item", ["gm_item_id"], help="gets metadata for an item using the gm_item_id", group="items")
+def get_gm_item(gm, cli, gm_item_id):
+    nicePrint(gm.get_gm_item(gm_item_id))
+
+@command("get_gm_item_v2", ["gm_item_id"], help="gets metadata v2 for an item using the gm_item_id", group="items")
+def get_gm_item_v2(gm, cli, gm_item_id):
+    nicePrint(gm.get_gm_item_v2(gm_item_id))
+
+@command("create_gm_item_id_from_s3_key", ["s3_key"], help="create gm_item_id from an s3_key", group="s3")
+def create_gm_item_id_from_s3_key(gm, cli, s3_key):
+    nicePrint(gm.create_gm_item_id_from_s3_key(s3_key))
+
+@command("get_gm_item_id_from_s3_key", ["s3_key"], help="gets gm_item_id from an s3_key", group="s3")
+def get_gm_item_id_from_s3_key(gm, cli, s3_key):
+    gm_item_id = gm.get_gm_item_id_from_s3_key(s3_key)
+    print(gm_item_id)
+
+@command("get_gm_item_from_s3_key", ["s3_key"], help="gets metadata for an item using the s3_key", group="s3")
+def get_gm_item_from_s3_key(gm, cli, s3_key):
+    nicePrint(gm.get_gm_item_from_s3_key(s3_key))
+
+@command("resolve_s3_keys", flags="-in {file} -out {file}", help="gets the gm_item_id of every s3 key in a file as json lines", group="s3", options=[
+    ("-workers {n}", "lookups to run at a time (default 8)")])
+def resolve_s3_keys(gm, cli):
+    """
+    reads one s3 key per line and writes one json result per line, '-' is stdin/stdout
+    """
+    from . import jsoncodec
+    in_filename = cli.getOrDie("-in")
+    out_filename = cli.getOrDefault("-out", "-")
+    workers = int(cli.getOrDefault("-workers", "8"))
+
+    f_in = sys.stdin if in_filename == "-" else open(in_filename, "r")
+    f_out = sys.stdout if out_filename == "-" else open(out_filename, "w")
+    resolved_count = 0
+    error_count = 0
+    try:
+        for resolved in gm.resolve_s3_keys(f_in, workers):
+            f_out.write(jsoncodec.dumps(resolved) + "\n")
+            if resolved["error"] is None:
+                resolved_count += 1
+            else:
+                error_count += 1
+    finally:
+        if f_in is not sys.stdin:
+            f_in.close()
+        if f_out is not sys.stdout:
+            f_out.close()
+    sys.stderr.write("Resolved " + str(resolved_count) + " keys, " + str(error_count) + " errors.\n")
+
+@command("delete_gm_item", ["gm_item_id"], help="deletes the metadata from graymeta", group="delete")
+def delete_gm_item(gm, cli, gm_item_id):
+    nicePrint(gm.delete_gm_item(gm_item_id))
+
+@command("get_captions", ["gm_item_id"], help="returns the captions in json", group="captions")
+def get_captions(gm, cli, gm_item_id):
+    nicePrint(gm.get_captions(gm_item_id))
+
+@command("upload_captions", ["gm_item_id", "stl_filename"], help="uploads and associates an STL file with content", group="captions")
+def upload_captions(gm, cli, gm_item_id, stl_filename):
+    nicePrint(gm.upload_captions(gm_item_id, stl_filename))
+
+@command("delete_captions", ["gm_item_id", "captions_id"], help="deletes the captions from the item", group="captions")
+def delete_captions(gm, cli, gm_item_id, captions_id):
+    nicePrint(gm.delete_captions(gm_item_id, captions_id))
+
+@command("harvest_item_from_s3_key", ["s3_key", "extractors,,"], help="forces a harvest for an item via its S3 key", group="harvest")
+def harvest_item_from_s3_key(gm, cli, s3_key, extractors):
+    extractors = extractors.split(",")
+    response = gm.create_gm_item_id_from_s3_key(s3_key)
+    nicePrint(response)
+    #gm_item_id, location_id = gm.get_gm_item_id_from_s3_key(s3_key)
+    #nicePrint(gm.harvest_item(location_id, gm_item_id))
+
+@command("harvest_container", ["location_id", "container_id"], help="forces a harvest for an entire container.", group="harvest")
+def harvest_container(gm, cli, location_id, container_id):
+    nicePrint(gm.harvest_container(location_id, container_id))
+
+@command("harvest_bulk", flags="-in {jobs.jsonl}", help="harvests each {location_id, container_id[, stow_url]} per line", group="harvest", options=[
+    ("-progress_file {file}", "records submitted jobs so a rerun resumes"),
+    ("-max_pending {n} -max_queue_depth {n}", "pause while the server has this much work (100, 1000)"),
+    ("-max_retries {n}", "gives up on a job the server keeps rejecting as overloaded (5)")])
+def harvest_bulk(gm, cli):
+    """
+    harvests every job in a json lines file at the rate the pipeline can take
+    """
+    from . import jsoncodec
+    from .harvest import HarvestScheduler
+    from .controller import GraymetaHTTPError
+    in_filename = cli.getOrDie("-in")
+    jobs = []
+    for line in open(in_filename, "r"):
+        if line.strip():
+            jobs.append(jsoncodec.loads(line))
+
+    scheduler = HarvestScheduler(gm,
+        progress_filename=cli.getOrDefault("-progress_file", None),
+        max_pending=int(cli.getOrDefault("-max_pending", "100")),
+        max_queue_depth=int(cli.getOrDefault("-max_queue_depth", "1000")),
+        max_batch=int(cli.getOrDefault("-max_batch", "50")),
+        max_retries=int(cli.getOrDefault("-max_retries", "5")),
+        poll_interval=float(cli.getOrDefault("-poll_interval", "5")))
+    try:
+        scheduler.run(jobs)
+    except KeyboardInterrupt:
+        print("Harvest interrupted, rerun with the same -progress_file to resume.")
+        sys.exit(130)
+    except GraymetaHTTPError as e:
+        print("Error, " + str(e) + ", rerun with the same -progress_file to resume.")
+        sys.exit(1)
+    print("Harvest submitted")
+
+@command("comment", help="uses the Graymeta Comments API", group="comment")
+def comment(gm, cli):
+    subcommand = cli.getOrDefault("comment", "list")
+    gm_item_id = cli.getOrDie("-gm_item_id")
+
+    if subcommand == "add":
+        comment = cli.getOrDie("-m")
+        nicePrint(gm.add_comment(gm_item_id, comment))
+    elif subcommand == "list":
+        nicePrint(gm.list_comments(gm_item_id))
+    elif subcommand == "delete":
+        comment_id = cli.getOrDie("-comment_id")
+        nicePrint(gm.delete_comment(gm_item_id, comment_id))
+        nicePrint(gm.list_comments(gm_item_id))
+    else:
+        print("invalid comment command - try 'add, list, delete'")
+
+@command("keyword", help="uses the Graymeta Keywords API", group="keyword")
+def keyword(gm, cli):
+    subcommand = cli.getOrDie("keyword")
+    if subcommand == "list":
+        nicePrint(gm.keyword_list_groups())
+    elif subcommand == "get":
+        group_id = cli.getOrDie("-group_id")
+        nicePrint(gm.keyword_get_group(group_id))
+
+    elif subcommand == "create_group":
+        name = cli.getOrDie("-name")
+        color = "#" + cli.getOrDie("-color")
+        nicePrint(gm.keyword_create_group(name, color))
+    elif subcommand == "delete_group":
+        group_id = cli.getOrDie("-group_id")
+        nicePrint(gm.keyword_delete_group(group_id))
+    elif subcommand == "add_to_group":
+        group_id = cli.getOrDie("-group_id")
+        word = cli.getOrDie("-word")
+        nicePrint(gm.keyword_add_to_group(group_id, word))
+    elif subcommand == "remove_from_group":
+        group_id = cli.getOrDie("-group_id")
+        word = cli.getOrDie("-word")
+        nicePrint(gm.keyword_remove_from_group(group_id, word))
+    else:
+        print("gm keyword (list | get | create_group | delete_group | add_to_group | remove_from_group)")
+
+def interruptible(extract, cli):
+    try:
+        extract(cli)
+    except KeyboardInterrupt:
+        print("Extract interrupted.")
+        sys.exit(130)
+
+@command("extract_all", help="extracts all metadata", group="extract")
+def extract_all(gm, cli):
+    interruptible(gm.extract_all, cli)
+
+@command("extract_since", flags="-state_file {file}", help="extracts items harvested or modified since the last run", group="extract", options=[
+    ("-since {date}", "where to start when there is no state_file yet")])
+def extract_since(gm, cli):
+    interruptible(gm.extract_since, cli)
+
+@command("extract", flags="(-q term)", help="extracts all metadata where 'term' is present in the stow_url", group="extract", options=[
+    ("-q_file {file}", "match any of the patterns in a file, one per line"),
+    ("-match substring|glob|regex", "how -q and -q_file patterns match (default substring)"),
+    ("-pushdown", "search on the server for -q terms first, faster but its text search may miss some matches"),
+    ("-workers {n}", "extract n items at a time (default 1)"),
+    ("-page_size {n}", "search results fetched per request (default 1000)"),
+    ("-pretty | -compact", "re-encode the json indented or compact (default: as the server sent it)"),
+    ("-format files|archive", "archive writes compressed json lines shards + index.jsonl"),
+    ("-shard_size_mb {n} -compression gzip|zstd", "archive shard size (256) and compression (zstd if installed)")])
+def extract(gm, cli):
+    interruptible(gm.extract, cli)
+
+@command("archive_get", ["output_dir", "gm_item_id"], help="prints one item from an archive", group="extract", server=False)
+def archive_get(gm, cli, archive_dir, gm_item_id):
+    from .archive import ArchiveReader
+    nicePrint(ArchiveReader(archive_dir).read(gm_item_id))
+
+@command("index", flags="build -output_dir {dir} -db {file}", help="indexes extracted metadata locally (only new or changed items)", group="index", server=False, options=[
+    ("index query -db {file}", "queries the local index"),
+    ("-stow_url {s} -name {s} -container {id}", "stow_url and name match substrings"),
+    ("-from {date} -to {date} -date_field {f}", "last_harvested (default) or last_modified range"),
+    ("-text {words} -limit {n} -json", "full text search of the item metadata"),
+    ("-fts", "-text is fts5 query syntax (AND, OR, NEAR, prefix*)")])
+def local_index(gm, cli):
+    """
+    gm index build|query, a local sqlite index over extracted metadata
+    """
+    import sqlite3
+    from .index import MetadataIndex
+    subcommand = cli.getOrDie("index")
+    index = MetadataIndex(cli.getOrDefault("-db", "gm.db"))
+    try:
+        if subcommand == "build":
+            output_dir = cli.getOrDie("-output_dir")
+            indexed, skipped = index.build(output_dir, sys.stdout)
+            print("Indexed " + str(indexed) + " items, " + str(skipped) + " unchanged.")
+        elif subcommand == "query":
+            rows = index.query(stow_url=cli.getOrDefault("-stow_url", None),
+                name=cli.getOrDefault("-name", None),
+                container=cli.getOrDefault("-container", None),
+                date_field=cli.getOrDefault("-date_field", "last_harvested"),
+                date_from=cli.getOrDefault("-from", None),
+                date_to=cli.getOrDefault("-to", None),
+                text=cli.getOrDefault("-text", None),
+                limit=int(cli.getOrDefault("-limit", "100")),
+                fts_syntax=cli.containsKey("-fts"))
+            if cli.containsKey("-json"):
+                nicePrint(rows)
+            else:
+                print("ItemID".ljust(35)+"Last Harvested".ljust(27) + "Last Modified".ljust(27) + "Stow URL".ljust(20))
+                for row in rows:
+                    print((row["_id"] or "").ljust(35) + (row["last_harvested"] or "").ljust(27) + (row["last_modified"] or "").ljust(27) + (row["stow_url"] or "").ljust(20))
+        else:
+            print("gm index (build | query)")
+    except sqlite3.OperationalError as e:
+        print("Error, " + str(e) + ".")
+        sys.exit(1)
+    finally:
+        index.close()
+
+@command("stats", help="print current /api/control/system/stats data.", group="server")
+def stats(gm, cli):
+    nicePrint(gm.stats())
+
+@command("idle", help="prints True if there are no running or pending jobs.", group="server")
+def idle(gm, cli):
+    results = gm.isIdle()
+    print(results)
+
+@command("wait_idle", flags="-timeout_idle {seconds}", help="waits for no running or pending jobs, exits 0 when idle, 2 on timeout, 3 without stats.", group="server", options=[
+    ("-min_interval {s} -max_interval {s}", "polling backs off between these (1, 60)")])
+def wait_idle(gm, cli):
+    timeout = cli.getOrDefault("-timeout_idle", None)
+    if timeout is not None:
+        timeout = float(timeout)
+    min_interval = float(cli.getOrDefault("-min_interval", "1"))
+    max_interval = float(cli.getOrDefault("-max_interval", "60"))
+    from .controller import GraymetaHTTPError
+    try:
+        idle = gm.wait_until_idle(timeout, min_interval, max_interval)
+    except GraymetaHTTPError as e:
+        print("Error, " + str(e) + ".")
+        sys.exit(3)
+    if idle:
+        sys.exit(0)
+    else:
+        sys.exit(2)
 
-    elif command == "get_captions":
-        gm_item_id = sys.argv[2]
-        nicePrint(gm.get_captions(gm_item_id))
+@command("health", help="print current /api/data/healthz data.", group="server")
+def health(gm, cli):
+    nicePrint(gm.health())
 
-    elif command == "delete_captions":
-        gm_item_id = sys.argv[2]
-        captions_id = sys.argv[3]
-        nicePrint(gm.delete_captions(gm_item_id, captions_id))
+@command("activity", help="print current /api/data/activity data.", group="server")
+def activity(gm, cli):
+    nicePrint(gm.activity())
 
-    elif command == "disable_live_harvesting":
-        gm.disable_live_harvesting()
+# handled in main, listed here for the usage
+command("version", help="print current gmapi version number.", group="server", server=False)(version)
 
-    elif command == "extract_all":
-        gm.extract_all(cli)
+@command("summary_platform", help="print summary information about the platform.", group="server")
+def summary_platform(gm, cli):
+    nicePrint(gm.summary_platform())
 
-    elif command == "extract":
-        gm.extract(cli)
+@command("summary_data", help="print summary information about the data.", group="server")
+def summary_data(gm, cli):
+    nicePrint(gm.summary_data())
 
-    elif command == "scroll":
-        nicePrint(gm.scroll())
+@command("get", ["URL"], help="returns response from a GET.", group="server")
+def get(gm, cli, partial_url):
+    """
+    performs an authenticated GET to the API
+    """
+    nicePrint(gm.http_get(partial_url))
 
-    elif command == "features":
-        nicePrint(gm.features())
+# not in the usage
 
-    elif command == "summary_platform":
-        nicePrint(gm.summary_platform())
+@command("scroll")
+def scroll(gm, cli):
+    nicePrint(gm.scroll())
 
-    elif command == "summary_data":
-        nicePrint(gm.summary_data())
+@command("features")
+def features(gm, cli):
+    nicePrint(gm.features())
 
-    elif command == "comment":
-        cli = CLI(sys.argv)
-        command = cli.getOrDefault("comment", "list")
-        gm_item_id = cli.getOrDie("-gm_item_id")
+@command("user")
+def user(gm, cli):
+    nicePrint(gm.user())
 
-        if command == "add":
-            comment = cli.getOrDie("-m")
-            nicePrint(gm.add_comment(gm_item_id, comment))
-        elif command == "list":
-            nicePrint(gm.list_comments(gm_item_id))
-        elif command == "delete":
-            comment_id = cli.getOrDie("-comment_id")
-            nicePrint(gm.delete_comment(gm_item_id, comment_id))
-            nicePrint(gm.list_comments(gm_item_id))
-        else:
-            print("invalid comment command - try 'add, list, delete'")
-
-    elif command == "keyword":
-        cli = CLI(sys.argv)
-        command = cli.getOrDie("keyword")
-        if command == "list":
-            nicePrint(gm.keyword_list_groups())
-        elif command == "get":
-            group_id = cli.getOrDie("-group_id")
-            nicePrint(gm.keyword_get_group(group_id))
-
-        elif command == "create_group":
-            name = cli.getOrDie("-name")
-            color = "#" + cli.getOrDie("-color")
-            nicePrint(gm.keyword_create_group(name, color))
-        elif command == "delete_group":
-            group_id = cli.getOrDie("-group_id")
-            nicePrint(gm.keyword_delete_group(group_id))
-        elif command == "add_to_group":
-            group_id = cli.getOrDie("-group_id")
-            word = cli.getOrDie("-word")
-            nicePrint(gm.keyword_add_to_group(group_id, word))
-        elif command == "remove_from_group":
-            group_id = cli.getOrDie("-group_id")
-            word = cli.getOrDie("-word")
-            nicePrint(gm.keyword_remove_from_group(group_id, word))
-        else:
-            print("gm keyword (list | get | create_group | delete_group | add_to_group | remove_from_group)")
+@command("platform")
+def platform(gm, cli):
+    nicePrint(gm.platform())
 
-    elif command == "list_locations":
-        nicePrint(gm.list_locations())
+@command("compilations")
+def compilations(gm, cli):
+    nicePrint(gm.compilations())
 
-    elif command == "list_location":
-        location_id = sys.argv[2]
-        nicePrint(gm.list_location(location_id))
-
-    elif command == "list_all_containers":
-        location_id = sys.argv[2]
-        nicePrint(gm.list_containers(location_id))
-
-    elif command == "list_containers":
-        nicePrint(gm.list_enabled_containers())
-
-    elif command == "harvest_container":
-        location_id = sys.argv[2]
-        container_id = sys.argv[3]
-        nicePrint(gm.harvest_container(location_id, container_id))
-
-    elif command == "harvest_item_from_s3_key":
-        s3_key = sys.argv[2]
-        extractors = sys.argv[3].split(",")
-        response = gm.create_gm_item_id_from_s3_key(s3_key)
-        nicePrint(response)
-        #gm_item_id, location_id = gm.get_gm_item_id_from_s3_key(s3_key)
-        #nicePrint(gm.harvest_item(location_id, gm_item_id))
-
-        """
-        elif command == "harvest_item":
-            location_id = sys.argv[2]
-            gm_item_id = sys.argv[3]
-            nicePrint(gm.harvest_item(location_id, gm_item_id))
-        """
-
-    elif command == "create_gm_item_id_from_s3_key":
-        s3_key = sys.argv[2]
-        nicePrint(gm.create_gm_item_id_from_s3_key(s3_key))
-
-    elif command == "get_gm_item_id_from_s3_key":
-        s3_key = sys.argv[2]
-        gm_item_id = gm.get_gm_item_id_from_s3_key(s3_key)
-        print(gm_item_id)
-
-    elif command == "get_gm_item_id":
-        location_id = sys.argv[2]
-        container_id = sys.argv[3]
-        item_id = sys.argv[4]
-        nicePrint(gm.get_gm_item_id(location_id, container_id, item_id))
-
-    elif command == "get_gm_item_from_s3_key":
-        s3_key = sys.argv[2]
-        nicePrint(gm.get_gm_item_from_s3_key(s3_key))
-
-    elif command == "get_gm_item":
-        gm_item_id = sys.argv[2]
-        nicePrint(gm.get_gm_item(gm_item_id))
-
-    elif command == "get_gm_item_v2":
-        gm_item_id = sys.argv[2]
-        nicePrint(gm.get_gm_item_v2(gm_item_id))
-
-    elif command == "delete_gm_item":
-        gm_item_id = sys.argv[2]
-        nicePrint(gm.delete_gm_item(gm_item_id))
-
-    elif command == "health":
-        nicePrint(gm.health())
-
-    elif command == "stats":
-        nicePrint(gm.stats())
-
-    elif command == "activity":
-        nicePrint(gm.activity())
-
-    elif command == "user":
-        nicePrint(gm.user())
-
-    elif command == "platform":
-        nicePrint(gm.platform())
-
-    elif command == "compilations":
-        nicePrint(gm.compilations())
-
-    elif command == "search_quick":
-        results = gm.search_quick()
-        nicePrint(results)
-
-    elif command == "search_extracted":
-        results = gm.search_extracted()
-
-    elif command == "search_not_extracted":
-        results = gm.search_not_extracted()
-
-    elif command == "idle":
-        results = gm.isIdle()
-        print(results)
-
-    elif command == "search":
-
-        results = None
-        if cli.containsKey("-last_modified_from") or cli.containsKey("-last_modified_to"):
-            last_modified_from = cli.getOrDie("-last_modified_from")
-            last_modified_to = cli.getOrDie("-last_modified_to")
-            results = gm.search_last_modified(last_modified_from, last_modified_to)
-        elif cli.containsKey("-last_harvested_from") or cli.containsKey("-last_harvested_to"):
-            last_harvested_from = cli.getOrDie("-last_harvested_from")
-            last_harvested_to = cli.getOrDie("-last_harvested_to")
-            results = gm.search_last_harvested(last_harvested_from, last_harvested_to)
-        else:
-            results = gm.search()
+@command("search_quick")
+def search_quick(gm, cli):
+    results = gm.search_quick()
+    nicePrint(results)
 
-        if cli.containsKey("-json"):
-            nicePrint(results)
-        else:
-            if not "results" in results:
-                print("No results found.")
-                print(results)
-            else:
-                print("ItemID".ljust(35)+"Last Harvested".ljust(27) + "Last Modified".ljust(27) + "Name".ljust(20))
-                for entry in results["results"]:
-                    result = entry["result"]
-                    gm_item_id = result["_id"]
-                    container = result.get("stow_container_id") or "stow_container_id"
-                    name = result.get("name") or None
-                    last_modified = result.get("last_modified") or "no last modified."
-                    last_harvested = result.get("last_harvested") or "no last harvested."
-
-                    if name is not None:
-                        full_name = container + "/" + name
-                    else:
-                        full_name = "<not harvested> ( " + result.get("stow_url") + " )"
-
-                    print(gm_item_id.ljust(35) + last_harvested.ljust(27) + last_modified.ljust(27) + full_name.ljust(20))
-
-    elif command == "get":
-        """
-        performs an authenticated GET to the API
-        """
-        partial_url = sys.argv[2]
-        nicePrint(gm.http_get(partial_url))
+@command("search_extracted")
+def search_extracted(gm, cli):
+    results = gm.search_extracted()
 
-    else:
-        print("I don't know how to '" + command + "'")
-        sys.exit(1)
+@command("search_not_extracted")
+def search_not_extracted(gm, cli):
+    results = gm.search_not_extracted()
 
 def nicePrint(data):
+    from . import jsoncodec
     if data:
-        print(json.dumps(data, indent=4))
+        print(jsoncodec.dumps(data, indent=True))
     else:
         print("No data found.")
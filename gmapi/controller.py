@@ -0,0 +1,108 @@
+import time
+import random
+import threading
+import requests
+
+# worth trying again, the server is overloaded or restarting
+RETRY_STATUSES = (429, 502, 503, 504)
+# a dropped connection, a timeout or a body cut short
+RETRY_EXCEPTIONS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+
+class GraymetaHTTPError(Exception):
+
+    def __init__(self, message, status=None, response=None):
+        Exception.__init__(self, message)
+        self.status = status
+        self.response = response
+
+
+class RequestController():
+    """
+    Retries idempotent requests that fail with RETRY_STATUSES or a connection
+    error/timeout, using jittered exponential backoff or the server's Retry-After.
+
+    It also limits how many requests are in flight at once (AIMD): the limit grows
+    by one per limit's worth of good responses, and halves on an error or a
+    response slower than latency_target seconds, at most once a second.
+    """
+
+    def __init__(self, max_retries=5, backoff_base=0.5, backoff_max=60, initial_limit=10, min_limit=1, max_limit=10, latency_target=None):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.in_flight = 0
+        self.retries = 0
+        self._last_decrease = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, ok, seconds):
+        with self._cond:
+            self.in_flight -= 1
+            if ok and (self.latency_target is None or seconds <= self.latency_target):
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            else:
+                now = time.time()
+                if now - self._last_decrease > 1:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self._last_decrease = now
+            self._cond.notify_all()
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        seconds to wait before retry number attempt (from 1)
+        """
+        if retry_after:
+            try:
+                return min(self.backoff_max, float(retry_after))
+            except ValueError:
+                # an http date, not worth parsing, fall through to our own backoff
+                pass
+        # "full jitter"
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def run(self, send, idempotent):
+        """
+        calls send() until it gives a response that is not worth retrying, or retries
+        run out, and returns that response.  RETRY_EXCEPTIONS are raised once
+        retries run out; non idempotent requests are never retried.
+        """
+        attempt = 0
+        while True:
+            self.acquire()
+            start = time.time()
+            try:
+                r = send()
+            except RETRY_EXCEPTIONS:
+                self.release(False, time.time() - start)
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                time.sleep(self.backoff(attempt))
+                continue
+            except BaseException:
+                # anything else (a hook, a bad body) still gives the slot back
+                self.release(False, time.time() - start)
+                raise
+
+            ok = r.status_code not in RETRY_STATUSES
+            self.release(ok, time.time() - start)
+            if ok or not idempotent or attempt >= self.max_retries:
+                return r
+            attempt += 1
+            self.retries += 1
+            retry_after = r.headers.get("Retry-After")
+            # give the connection back, the body is not wanted
+            r.close()
+            time.sleep(self.backoff(attempt, retry_after))
@@ -0,0 +1,106 @@
+"""
+Writes search results as they are paged in, for gm search -format:
+
+    jsonl   one search entry per line (or {field: value} with fields)
+    csv     a header row, then one row per result
+    tsv     the same, tab separated
+    table   the fixed width listing
+
+Rows are written to the output a batch at a time so a pipe gets them as each page
+arrives without a write per row.
+"""
+import csv
+import sys
+from . import jsoncodec
+from .model import SearchResult
+
+FORMATS = ["jsonl", "csv", "tsv", "table"]
+
+DEFAULT_FIELDS = ["_id", "last_harvested", "last_modified", "stow_container_id", "name", "stow_url"]
+
+def field_value(result, field):
+    """
+    field may be a dotted path, e.g. location.name
+    """
+    value = result
+    for key in field.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+class _Lines():
+    """
+    a write() target that holds lines until flush
+    """
+
+    def __init__(self, out, batch_size):
+        self.out = out
+        self.batch_size = batch_size
+        self.lines = []
+
+    def write(self, line):
+        self.lines.append(line)
+        if len(self.lines) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.out.write("".join(self.lines))
+            self.lines = []
+        self.out.flush()
+
+
+def write_results(entries, format="table", fields=None, out=None, batch_size=500):
+    """
+    entries are search entries ({"result": {...}}) as iter_search gives them,
+    returns the number written
+    """
+    out = out or sys.stdout
+    lines = _Lines(out, batch_size)
+    count = 0
+    if format == "jsonl":
+        for entry in entries:
+            if fields:
+                entry = dict((field, field_value(entry["result"], field)) for field in fields)
+            lines.write(jsoncodec.dumps(entry) + "\n")
+            count += 1
+    elif format == "csv" or format == "tsv":
+        fields = fields or DEFAULT_FIELDS
+        writer = csv.writer(lines, delimiter="," if format == "csv" else "\t", lineterminator="\n")
+        writer.writerow(fields)
+        for entry in entries:
+            row = []
+            for field in fields:
+                value = field_value(entry["result"], field)
+                if isinstance(value, (dict, list)):
+                    value = jsoncodec.dumps(value)
+                row.append("" if value is None else value)
+            writer.writerow(row)
+            count += 1
+    elif fields:
+        for entry in entries:
+            if count == 0:
+                lines.write("".join(field.ljust(27) for field in fields).rstrip() + "\n")
+            values = [field_value(entry["result"], field) for field in fields]
+            lines.write("".join(("" if value is None else str(value)).ljust(27) for value in values).rstrip() + "\n")
+            count += 1
+    else:
+        for entry in entries:
+            if count == 0:
+                lines.write("ItemID".ljust(35)+"Last Harvested".ljust(27) + "Last Modified".ljust(27) + "Name".ljust(20) + "\n")
+            count += 1
+            result = SearchResult.from_entry(entry, keep_document=False)
+            container = result.stow_container_id or "stow_container_id"
+            last_modified = result.last_modified or "no last modified."
+            last_harvested = result.last_harvested or "no last harvested."
+
+            if result.name:
+                full_name = container + "/" + result.name
+            else:
+                full_name = "<not harvested> ( " + result.stow_url + " )"
+
+            lines.write(result.gm_item_id.ljust(35) + last_harvested.ljust(27) + last_modified.ljust(27) + full_name.ljust(20) + "\n")
+    lines.flush()
+    return count
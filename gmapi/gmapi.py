@@ -1,17 +1,89 @@
 import os
 import sys
 import json
+import time
+import gzip
+import threading
 import requests
-from .cli import CLI
+from requests.adapters import HTTPAdapter
+from .checkpoint import CheckpointStore
+from .jsonstream import iter_results_file
+from .metacache import MetadataCache
+from .model import SearchResult
+from .query import SearchQuery
+from .match import compile_matcher, read_patterns
+from .singleflight import SingleFlight
+from .archive import ArchiveWriter
+from .metrics import Metrics, endpoint_template
+from . import jsoncodec
+from .controller import RequestController, GraymetaHTTPError, IDEMPOTENT_METHODS, RETRY_EXCEPTIONS, RETRY_STATUSES
 from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+_DEBUG_CONFIGURED = False
+
+try:
+    # what urllib3 can decode here, gzip and deflate plus br/zstd if brotli/zstandard are installed
+    from urllib3.util.request import ACCEPT_ENCODING
+except ImportError:
+    ACCEPT_ENCODING = "gzip,deflate"
+
+# extract sends one search per term, past this many one scan of every item is cheaper
+MAX_PUSHDOWN_TERMS = 20
 
 class GraymetaClient():
 
-    def __init__(self, server_url, api_key):
+    def __init__(self, server_url, api_key, pool_connections=10, pool_maxsize=10, pool_block=False, keep_alive=True, timeout=None, ssl_verify=True, metadata_cache_ttl=300, metadata_cache_file=None, max_retries=5, latency_target=None, singleflight=None, compress_responses=True, compress_requests=False, compress_min_size=1024):
+        """
+        All calls share one pooled, keep-alive requests.Session which is safe to
+        use from several threads.  pool_maxsize is the number of connections kept
+        per host, pool_block=True makes callers wait for one rather than open more.
+        timeout is seconds or a (connect, read) tuple.
+        Locations and containers are cached for metadata_cache_ttl seconds, and
+        saved to metadata_cache_file if given.
+        Idempotent requests are retried up to max_retries times and in-flight
+        requests are limited by self.controller (see RequestController).
+        singleflight is a list of endpoint templates, e.g. "/api/data/items/{id}",
+        whose concurrent identical GETs share one request (see enable_singleflight).
+        Responses are asked for compressed with every encoding that can be decoded
+        here unless compress_responses=False, and compress_requests=True gzips
+        request bodies of compress_min_size bytes or more; the server must accept
+        Content-Encoding: gzip.
+        """
         self.SERVER_URL = server_url
         self.API_KEY = api_key
         self.HEADERS = { "Authorization": "Bearer " + self.API_KEY }
+        if not keep_alive:
+            self.HEADERS["Connection"] = "close"
+        self.HEADERS["Accept-Encoding"] = ACCEPT_ENCODING if compress_responses else "identity"
+        self.compress_requests = compress_requests
+        self.compress_min_size = compress_min_size
+        self._local = threading.local()
+        self.SSL_VERIFY = ssl_verify
+        self.TIMEOUT = timeout
         self.verbose = False
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.metadata_cache = MetadataCache(metadata_cache_ttl, metadata_cache_file)
+        self.metrics = Metrics()
+        self.controller = RequestController(max_retries=max_retries, initial_limit=pool_maxsize, max_limit=pool_maxsize, latency_target=latency_target)
+        self.pre_request_hooks = []
+        self.post_request_hooks = []
+        self.singleflight = SingleFlight()
+        self.singleflight_endpoints = set()
+        self.enable_singleflight(*(singleflight or []))
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def summary_platform(self):
         return self.http_get("/api/data/summary/platform")
@@ -26,142 +98,317 @@ class GraymetaClient():
 
         # cache file file is the set of items already downloaded *not* to download again
         cache_filename = cli.getOrDie("-cache_file")
-        if os.path.isfile(cache_filename):
-            cache = json.loads(open(cache_filename, 'r').read())
-        else:
-            cache = []
+        cache = CheckpointStore(cache_filename)
+        print("Loaded " + str(len(cache)) + " already processed items from " + cache_filename)
 
         # a little cache so I don't have to re-extract
         output_dir = cli.getOrDie("-output_dir")
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        # search file is a results of a previous search call so we don't
-        # have to call search again.  Use if present.
-        if cli.containsKey("-search_file"):
-            print("Not calling search, using file")
-            search_filename = cli.getOrDie("-search_file")
-            search_response = json.loads(open(search_filename, 'r').read())
-            print("Loaded search file ok.")
-        else:
-            print("Calling search")
-            search_response = self.search()
-            print("Called search, now extracting results")
-
-
-        total_results = len(search_response["results"])
-        print("Retrieved " + str(total_results) + " results.")
-        for r in search_response["results"]:
-            start_time = datetime.today()
-            result = r["result"]
-            stow_url = result["stow_url"]
-            filename = stow_url.split("/")[-1]
-            execution_id = stow_url.split("/")[-3] + "/" + stow_url.split("/")[-2]
-            gm_item_id = result["_id"]
-            if gm_item_id in cache:
-                print("Already processed " + gm_item_id + ", not extracting again.")
-                continue
-
-            if not os.path.exists(output_dir + "/" + execution_id):
-                os.makedirs(output_dir + "/" + execution_id)
-
-            if "name" in result:
-                # then it has been harvested
-                gm_item = self.get_gm_item(gm_item_id)
-                gm_item_v2 = self.get_gm_item_v2(gm_item_id)
-
-                f1 = open(output_dir + "/" + execution_id + "/" + filename + "_v1.json", "w")
-                f1.write(json.dumps(gm_item, indent=4))
-                f1.close()
-
-                f2 = open(output_dir + "/" + execution_id + "/" + filename + "_v2.json", "w")
-                f2.write(json.dumps(gm_item_v2, indent=4))
-                f2.close()
-
-                f3 = open(output_dir + "/" + execution_id + "/" + filename + "_index.json", "w")
-                f3.write(json.dumps(result, indent=4))
-                f3.close()
-
-                cache.append(gm_item_id)
-
-                open(cache_filename, 'w').write(json.dumps(cache, indent=4))
-                ttl = (datetime.today() - start_time).seconds
-                print("Processed " + gm_item_id + " in " + str(ttl) + "s.")
-            else:
-                print(gm_item_id + " not harvested yet.")
+        results = self._search_results(cli)
 
+        workers = int(cli.getOrDefault("-workers", "1"))
+        archive = self._archive_writer(cli, output_dir)
+        try:
+            self._extract_results(results, output_dir, workers, cache, cache.add, archive, self._output_mode(cli))
+        finally:
+            cache.close()
+            if archive is not None:
+                archive.close()
 
+        print("Extract Complete")
 
+    def extract_since(self, cli):
+        """
+        Extracts only the items harvested or modified since the last extract_since run.
+        The newest last_harvested/last_modified seen is kept in -state_file and changed
+        items are re-extracted even if they are already in the cache.
+        """
+        cache_filename = cli.getOrDie("-cache_file")
+        state_filename = cli.getOrDie("-state_file")
+        output_dir = cli.getOrDie("-output_dir")
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
 
-        print("Called search ok, now fetching content.")
+        if os.path.isfile(state_filename):
+            state = json.loads(open(state_filename, 'r').read())
+        else:
+            state = {}
+
+        since = cli.getOrDefault("-since", "1970-01-01T00:00:00Z")
+        now = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+        page_size = int(cli.getOrDefault("-page_size", "1000"))
+        watermark = dict(state)
+
+        def changed_results():
+            seen = set()
+            for field in ("last_harvested", "last_modified"):
+                date_from = state.get(field) or since
+                print("Searching for items with " + field + " from " + date_from + " to " + now)
+                for result in self.iter_search_results({ field: { "from": date_from, "to": now } }, page_size):
+                    for f, value in (("last_harvested", result.last_harvested), ("last_modified", result.last_modified)):
+                        if value and value > (watermark.get(f) or ""):
+                            watermark[f] = value
+                    if result.gm_item_id in seen:
+                        continue
+                    seen.add(result.gm_item_id)
+                    yield result
+
+        cache = CheckpointStore(cache_filename)
+        workers = int(cli.getOrDefault("-workers", "1"))
+        archive = self._archive_writer(cli, output_dir)
+        failed = []
+        try:
+            # no cache to check against, changed items are always re-extracted
+            self._extract_results(changed_results(), output_dir, workers, None, cache.add, archive, self._output_mode(cli), failed.append)
+        finally:
+            cache.close()
+            if archive is not None:
+                archive.close()
+
+        # only move the watermark on once everything up to it has been extracted,
+        # failed items are searched for again next time
+        for result in failed:
+            for f, value in (("last_harvested", result.last_harvested), ("last_modified", result.last_modified)):
+                if value and (f not in watermark or value < watermark[f]):
+                    watermark[f] = value
+        if failed:
+            print(str(len(failed)) + " items failed, they will be extracted again next time.")
+        tmp_filename = state_filename + ".tmp"
+        open(tmp_filename, 'w').write(json.dumps(watermark, indent=4))
+        os.replace(tmp_filename, state_filename)
+        print("Saved watermark " + json.dumps(watermark) + " to " + state_filename)
         print("Extract Complete")
 
     def extract(self, cli):
         """
-        Extracts all items whose stow_url matches a search term
+        Extracts all items whose stow_url matches -q, or any pattern in -q_file.
+        Every item is checked here unless -pushdown, which sends substring terms to
+        the server's text search and only checks what it returns.  That search is
+        tokenized, so it can miss items a substring match would find.
         """
-
-        search_term = cli.getOrDie("-q")
-        print("Extracting all items with '" + search_term + "' in their stow_url.")
-
-        # search file is a results of a previous search call so we don't
-        # have to call search again.  Use if present.
-        if cli.containsKey("-search_file"):
-            print("Not calling search, using file")
-            search_filename = cli.getOrDie("-search_file")
-            search_response = json.loads(open(search_filename, 'r').read())
-            print("Loaded search file ok.")
+        patterns = []
+        if cli.containsKey("-q"):
+            patterns.append(cli.getOrDie("-q"))
+        if cli.containsKey("-q_file"):
+            patterns.extend(read_patterns(cli.getOrDie("-q_file")))
+        if not patterns:
+            cli.getOrDie("-q")
+        mode = cli.getOrDefault("-match", "substring")
+        try:
+            matcher = compile_matcher(patterns, mode)
+        except ValueError as e:
+            print("Bad -match, " + str(e))
+            sys.exit(1)
+        if len(patterns) == 1:
+            print("Extracting all items with '" + patterns[0] + "' in their stow_url (" + mode + ").")
         else:
-            print("Calling search")
-            search_response = self.search()
-            print("Called search, now extracting results")
+            print("Extracting all items matching any of " + str(len(patterns)) + " patterns in their stow_url (" + mode + ").")
 
         # a little cache so I don't have to re-extract
         output_dir = cli.getOrDie("-output_dir")
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        for r in search_response["results"]:
-            start_time = datetime.today()
-            result = r["result"]
-            stow_url = result["stow_url"]
-
-            should_download = stow_url.find(search_term) > -1
-
-            filename = stow_url.split("/")[-1]
-            execution_id = stow_url.split("/")[-3] + "/" + stow_url.split("/")[-2]
-            gm_item_id = result["_id"]
+        if cli.containsKey("-pushdown") and not cli.containsKey("-search_file") and mode == "substring" and len(patterns) <= MAX_PUSHDOWN_TERMS:
+            matches = self._pushdown_matches(patterns, matcher, int(cli.getOrDefault("-page_size", "1000")))
+        else:
+            matches = (r for r in self._search_results(cli) if matcher(r.stow_url))
+        workers = int(cli.getOrDefault("-workers", "1"))
+        archive = self._archive_writer(cli, output_dir)
+        try:
+            self._extract_results(matches, output_dir, workers, None, None, archive, self._output_mode(cli))
+        finally:
+            if archive is not None:
+                archive.close()
 
-            if not should_download:
-                continue
+        print("Extract Complete")
 
-            if not os.path.exists(output_dir + "/" + execution_id):
-                os.makedirs(output_dir + "/" + execution_id)
+    def _pushdown_matches(self, terms, matcher, page_size):
+        """
+        searches for each term on the server and yields the results that match.
+        The server's text search may tokenize differently to a substring match, so
+        if it finds nothing at all every item is scanned instead.
+        """
+        seen = set()
+        for term in terms:
+            print("Calling search for '" + term + "', " + str(page_size) + " results at a time")
+            for result in self.iter_search_results(SearchQuery().query(term), page_size):
+                if result.gm_item_id not in seen and matcher(result.stow_url):
+                    seen.add(result.gm_item_id)
+                    yield result
+        if not seen:
+            print("The server's search found no matches, checking every item instead")
+            for result in self.iter_search_results(page_size=page_size):
+                if matcher(result.stow_url):
+                    yield result
+
+    def _output_mode(self, cli):
+        """
+        raw (the default) writes the server's json as it is, -pretty or -compact decode and re-encode it
+        """
+        if cli.containsKey("-pretty"):
+            return "pretty"
+        elif cli.containsKey("-compact"):
+            return "compact"
+        else:
+            return "raw"
 
-            if "name" in result:
-                # then it has been harvested
-                gm_item = self.get_gm_item(gm_item_id)
-                gm_item_v2 = self.get_gm_item_v2(gm_item_id)
+    def _archive_writer(self, cli, output_dir):
+        """
+        An ArchiveWriter for -format archive, None for the default -format files
+        """
+        output_format = cli.getOrDefault("-format", "files")
+        if output_format == "files":
+            return None
+        elif output_format == "archive":
+            shard_size = int(cli.getOrDefault("-shard_size_mb", "256")) * 1024 * 1024
+            archive = ArchiveWriter(output_dir, shard_size, cli.getOrDefault("-compression", None))
+            print("Writing " + archive.compression + " compressed shards to " + output_dir)
+            return archive
+        else:
+            print("Unknown -format '" + output_format + "', use files or archive")
+            sys.exit(1)
 
-                f1 = open(output_dir + "/" + execution_id + "/" + filename + "_v1.json", "w")
-                f1.write(json.dumps(gm_item, indent=4))
-                f1.close()
+    def _search_results(self, cli):
+        """
+        The search results to extract, either from -search_file or paged from the server
+        """
+        # search file is a results of a previous search call so we don't
+        # have to call search again.  Use if present.
+        if cli.containsKey("-search_file"):
+            search_filename = cli.getOrDie("-search_file")
+            print("Not calling search, reading results from " + search_filename)
+            return (SearchResult.from_entry(r) for r in iter_results_file(search_filename))
+        else:
+            page_size = int(cli.getOrDefault("-page_size", "1000"))
+            print("Calling search, " + str(page_size) + " results at a time")
+            return self.iter_search_results(page_size=page_size)
 
-                f2 = open(output_dir + "/" + execution_id + "/" + filename + "_v2.json", "w")
-                f2.write(json.dumps(gm_item_v2, indent=4))
-                f2.close()
+    def _extract_results(self, results, output_dir, workers=1, cache=None, on_extracted=None, archive=None, output_mode="raw", on_failed=None):
+        """
+        Extracts each SearchResult in turn, or with a pool of workers when workers > 1.
+        Progress is always reported in the order of the results and on_extracted is
+        called from this thread for each item written, on_failed with the SearchResult
+        of each item that could not be.  Items go to the archive instead of separate
+        files when one is given.
+        """
+        if cache is None:
+            cache = []
 
-                f3 = open(output_dir + "/" + execution_id + "/" + filename + "_index.json", "w")
-                f3.write(json.dumps(result, indent=4))
-                f3.close()
+        if workers <= 1:
+            for r in results:
+                self._report_extracted(r, self._extract_result(r, output_dir, cache, None, archive, output_mode), on_extracted, on_failed)
+            return
 
-                ttl = (datetime.today() - start_time).seconds
-                print("Processed " + gm_item_id + " in " + str(ttl) + "s.")
+        # v2 fetches get their own pool so an item worker never waits on its own pool
+        item_pool = ThreadPoolExecutor(max_workers=workers)
+        v2_pool = ThreadPoolExecutor(max_workers=workers)
+        in_flight = deque()
+        try:
+            for r in results:
+                in_flight.append((r, item_pool.submit(self._extract_result, r, output_dir, cache, v2_pool, archive, output_mode)))
+                # bound the work queued ahead; the oldest is reported first which keeps the output ordered
+                if len(in_flight) >= workers * 2:
+                    r, future = in_flight.popleft()
+                    self._report_extracted(r, future.result(), on_extracted, on_failed)
+            while in_flight:
+                r, future = in_flight.popleft()
+                self._report_extracted(r, future.result(), on_extracted, on_failed)
+        except KeyboardInterrupt:
+            print("Interrupted, waiting for " + str(len(in_flight)) + " in-flight items to finish.")
+            for r, future in in_flight:
+                future.cancel()
+            item_pool.shutdown(wait=True)
+            for r, future in in_flight:
+                if not future.cancelled():
+                    self._report_extracted(r, future.result(), on_extracted, on_failed)
+            raise
+        finally:
+            item_pool.shutdown(wait=True)
+            v2_pool.shutdown(wait=True)
+
+    def _report_extracted(self, result, extracted, on_extracted, on_failed):
+        gm_item_id, message, failed = extracted
+        if gm_item_id is not None and on_extracted is not None:
+            on_extracted(gm_item_id)
+        if failed and on_failed is not None:
+            on_failed(result)
+        print(message)
+
+    def _extract_result(self, result, output_dir, cache, v2_pool=None, archive=None, output_mode="raw"):
+        """
+        Writes the _v1, _v2 and _index json for a single search result, or one archive record.
+        output_mode "raw" streams the server's json straight to disk, "pretty" and "compact"
+        decode it and write it indented or not.
+        Returns the gm_item_id if it was extracted (None otherwise), a progress message
+        and whether it failed.
+        """
+        start_time = datetime.today()
+        gm_item_id = result.gm_item_id
+        if gm_item_id in cache:
+            return None, "Already processed " + gm_item_id + ", not extracting again.", False
+
+        if not result.harvested:
+            return None, gm_item_id + " not harvested yet.", False
+
+        # then it has been harvested
+        item_dir = output_dir + "/" + result.execution_id
+        v1_filename = item_dir + "/" + result.filename + "_v1.json"
+        v2_filename = item_dir + "/" + result.filename + "_v2.json"
+        index_filename = item_dir + "/" + result.filename + "_index.json"
+        v1_url = "/api/data/items/" + gm_item_id
+        v2_url = "/files/" + gm_item_id + "/metadata2.json"
+        try:
+            if archive is not None:
+                gm_item, gm_item_v2 = self._fetch_both(lambda: self.get_raw(v1_url), lambda: self.get_raw(v2_url), v2_pool)
+                if gm_item is None or gm_item_v2 is None:
+                    return None, "Failed to extract " + gm_item_id + ": metadata not found", True
+                archive.write_raw(gm_item_id, gm_item, gm_item_v2, result.raw)
+            elif output_mode == "raw":
+                self._makedirs(item_dir)
+                v1_ok, v2_ok = self._fetch_both(lambda: self.download(v1_url, v1_filename), lambda: self.download(v2_url, v2_filename), v2_pool)
+                if not v1_ok or not v2_ok:
+                    return None, "Failed to extract " + gm_item_id + ": metadata not found", True
+                with open(index_filename, "wb") as f:
+                    f.write(result.raw)
             else:
-                print(gm_item_id + " not harvested yet.")
-
-        print("Extract Complete")
+                gm_item, gm_item_v2 = self._fetch_both(lambda: self.get_gm_item(gm_item_id), lambda: self.get_gm_item_v2(gm_item_id), v2_pool)
+                if gm_item is None or gm_item_v2 is None:
+                    return None, "Failed to extract " + gm_item_id + ": metadata not found", True
+                indent = output_mode == "pretty"
+                self._makedirs(item_dir)
+                jsoncodec.dump_file(gm_item, v1_filename, indent)
+                jsoncodec.dump_file(gm_item_v2, v2_filename, indent)
+                jsoncodec.dump_file(result.document, index_filename, indent)
+        except (GraymetaHTTPError, requests.RequestException) as e:
+            # not cached, so the next run tries it again
+            return None, "Failed to extract " + gm_item_id + ": " + str(e), True
+
+        ttl = (datetime.today() - start_time).seconds
+        return gm_item_id, "Processed " + gm_item_id + " in " + str(ttl) + "s.", False
+
+    def _fetch_both(self, fetch_v1, fetch_v2, v2_pool=None):
+        """
+        (fetch_v1(), fetch_v2()), with fetch_v2 on the v2_pool at the same time if there is one
+        """
+        if v2_pool is None:
+            return fetch_v1(), fetch_v2()
+        v2_future = v2_pool.submit(fetch_v2)
+        try:
+            v1 = fetch_v1()
+        finally:
+            v2 = v2_future.result()
+        return v1, v2
 
+    def _makedirs(self, path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            # another worker may have just created it
+            if not os.path.isdir(path):
+                raise
 
     def features(self):
         return self.http_get("/api/data/features")
@@ -221,20 +468,14 @@ class GraymetaClient():
         """
 
         print("gmapi.create_gm_item_id_from_s3_key(" + s3_key + ")")
-        key = s3_key.replace("s3://", "")
-        splits = key.split("/")
-        bucket = splits[0]
-        filename = "/".join(splits[1:])
-
-        locations = self.list_locations()
-        location_id = locations["locations"][0]["id"]
-        containers = self.list_containers(location_id)
+        bucket, filename = self._split_s3_key(s3_key)
 
-        container = None
-        for candidate_container in containers["containers"]:
-            if candidate_container["id"] == bucket:
-                container_id = candidate_container["id"]
-                break
+        location_id = self.default_location_id()
+        container = self.container_index(location_id).get(bucket)
+        if container is None:
+            print("No container found matching '" + bucket + "'")
+            return None
+        container_id = container["id"]
 
         url = "/api/control/item-id"
         post_data = { "location_id": location_id, "container_id": container_id, "item_id": filename }
@@ -252,20 +493,10 @@ class GraymetaClient():
 
 
     def get_gm_item_id_from_s3_key(self, s3_key):
-        key = s3_key.replace("s3://", "")
-        splits = key.split("/")
-        bucket = splits[0]
-        filename = "/".join(splits[1:])
+        bucket, filename = self._split_s3_key(s3_key)
 
-        locations = self.list_locations()
-        location_id = locations["locations"][0]["id"]
-        containers = self.list_enabled_containers()
-
-        container = None
-        for candidate_container in containers:
-            if candidate_container["id"] == bucket:
-                container = candidate_container
-                break
+        location_id = self.default_location_id()
+        container = self.container_index().get(bucket)
 
         if container is None:
             print("No container found matching '" + bucket + "'")
@@ -279,15 +510,105 @@ class GraymetaClient():
                 return None, None
 
 
+    def resolve_s3_keys(self, s3_keys, workers=8, batch_size=1000):
+        """
+        Yields { "s3_key", "bucket", "gm_item_id", "error" } for each s3 key, reading
+        s3_keys a batch at a time so any size of input can be streamed through.
+        Within a batch keys are grouped by bucket and looked up concurrently; an
+        unknown bucket or key is reported in "error" rather than stopping.
+        """
+        location_id = self.default_location_id()
+        containers = self.container_index()
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            batch = []
+            for s3_key in s3_keys:
+                s3_key = s3_key.strip()
+                if not s3_key:
+                    continue
+                batch.append(s3_key)
+                if len(batch) >= batch_size:
+                    for resolved in self._resolve_s3_key_batch(pool, location_id, containers, batch):
+                        yield resolved
+                    batch = []
+            if batch:
+                for resolved in self._resolve_s3_key_batch(pool, location_id, containers, batch):
+                    yield resolved
+        finally:
+            pool.shutdown(wait=True)
+
+    def _resolve_s3_key_batch(self, pool, location_id, containers, batch):
+        by_bucket = {}
+        for s3_key in batch:
+            bucket, filename = self._split_s3_key(s3_key)
+            by_bucket.setdefault(bucket, []).append((s3_key, filename))
+
+        pending = []
+        for bucket, keys in by_bucket.items():
+            container = containers.get(bucket)
+            for s3_key, filename in keys:
+                if container is None:
+                    pending.append((s3_key, bucket, None))
+                else:
+                    pending.append((s3_key, bucket, pool.submit(self.get_gm_item_id, str(location_id), str(container["id"]), str(filename))))
+
+        for s3_key, bucket, future in pending:
+            resolved = { "s3_key": s3_key, "bucket": bucket, "gm_item_id": None, "error": None }
+            if future is None:
+                resolved["error"] = "No container found matching '" + bucket + "'"
+            else:
+                try:
+                    item_data = future.result()
+                    if item_data is None:
+                        resolved["error"] = "Item not found"
+                    else:
+                        resolved["gm_item_id"] = item_data["gm_item_id"]
+                except Exception as e:
+                    resolved["error"] = str(e)
+            yield resolved
+
+    def _split_s3_key(self, s3_key):
+        """
+        s3://bucket/path/to/file -> (bucket, path/to/file)
+        """
+        key = s3_key.replace("s3://", "")
+        splits = key.split("/")
+        return splits[0], "/".join(splits[1:])
+
+    def default_location_id(self):
+        """
+        the first location, which is the one the s3 key lookups use
+        """
+        locations = self.metadata_cache.get_or_load("locations", self.list_locations)
+        return locations["locations"][0]["id"]
+
+    def container_index(self, location_id=None):
+        """
+        dict of container id (the bucket) -> container, for the enabled containers
+        or for all of a location's containers when location_id is given
+        """
+        if location_id is None:
+            index = self.metadata_cache.get_or_load("enabled_containers", lambda: self._index_containers(self.list_enabled_containers()))
+        else:
+            index = self.metadata_cache.get_or_load("containers/" + location_id, lambda: self._index_containers((self.list_containers(location_id) or {}).get("containers")))
+        return index or {}
+
+    def _index_containers(self, containers):
+        if containers is None:
+            return None
+        index = {}
+        for container in containers:
+            index[container["id"]] = container
+        return index
+
+    def invalidate_metadata_cache(self, key=None):
+        self.metadata_cache.invalidate(key)
+
     def get_gm_item_id(self, location_id, container_id, item_id):
-        url = self.SERVER_URL + "/api/control/item-id"
         data = { "location_id": location_id, "container_id": container_id, "item_id": item_id }
-        data_str = json.dumps(data)
-        headers = self.HEADERS
-        self._setupDebug()
-        r = requests.post(url, data=data_str, headers=headers)
+        r = self._request("POST", "/api/control/item-id", idempotent=True, data=jsoncodec.dumps_bytes(data))
         if r.status_code >= 200 and r.status_code <= 299:
-            return r.json()
+            return jsoncodec.loads(r.content)
         else:
             return None
 
@@ -297,34 +618,32 @@ class GraymetaClient():
     def get_gm_item_v2(self, gm_item_id):
         return self.http_get("/files/" + gm_item_id + "/metadata2.json")
 
+    def download_gm_item(self, gm_item_id, filename):
+        return self.download("/api/data/items/" + gm_item_id, filename)
+
+    def download_gm_item_v2(self, gm_item_id, filename):
+        return self.download("/files/" + gm_item_id + "/metadata2.json", filename)
+
     def list_items(self, container_id):
         return self.http_get("/api/data/items")
 
     def delete_gm_item(self, gm_item_id):
-        url = self.SERVER_URL + "/api/data/items/" + gm_item_id
-        headers = self.HEADERS
-        self._setupDebug()
-        r = requests.delete(url, headers=headers)
-        return r.json()
+        r = self._request("DELETE", "/api/data/items/" + gm_item_id)
+        return jsoncodec.loads(r.content)
 
     def upload_captions(self, gm_item_id, stl_filename):
-        url = self.SERVER_URL + "/api/data/items/" + gm_item_id + "/captions"
-        headers = self.HEADERS
-        files = { "caption_file": open(stl_filename, 'rb') }
-        self._setupDebug()
-        r = requests.post(url, files=files, headers=headers)
-        return r.json()
+        with open(stl_filename, 'rb') as f:
+            files = { "caption_file": f }
+            r = self._request("POST", "/api/data/items/" + gm_item_id + "/captions", files=files)
+        return jsoncodec.loads(r.content)
 
     def get_captions(self, gm_item_id):
         url = "/api/data/items/" + gm_item_id + "?only=captions.captions"
         return self.http_get(url)
 
     def delete_captions(self, gm_item_id, captions_id):
-        url = self.SERVER_URL + "/api/data/items/" + gm_item_id + "/captions?caption_id=" + captions_id
-        headers = self.HEADERS
-        self._setupDebug()
-        r = requests.delete(url, headers=headers)
-        return r.json()
+        r = self._request("DELETE", "/api/data/items/" + gm_item_id + "/captions?caption_id=" + captions_id)
+        return jsoncodec.loads(r.content)
   
     def list_location(self, location_id):
         return self.http_get("/api/data/locations/" + location_id)
@@ -353,6 +672,81 @@ class GraymetaClient():
         pending_jobs = stats.get("jobs").get("pending") or 0
         return (running_jobs + pending_jobs) == 0
 
+    def wait_until_idle(self, timeout=None, min_interval=1, max_interval=60, out=None):
+        """
+        Polls stats() until no jobs are running or pending, returning True, or False
+        if timeout seconds pass first.  The poll interval doubles while nothing changes
+        and drops back to min_interval when it does.  Each poll writes the queue depths
+        that changed and an estimated time to drain to out (default stdout).
+        A poll that fails is written to out and retried, stats() returning nothing
+        (e.g. a bad key) raises GraymetaHTTPError.
+        """
+        out = out or sys.stdout
+        start = time.time()
+        interval = min_interval
+        previous = None
+        first_total = None
+
+        def wait(interval):
+            if timeout is not None:
+                remaining = timeout - (time.time() - start)
+                if remaining <= 0:
+                    out.write("Timed out after " + str(timeout) + "s.\n")
+                    return False
+                interval = min(interval, remaining)
+            time.sleep(interval)
+            return True
+
+        while True:
+            try:
+                stats = self.stats()
+            except (GraymetaHTTPError,) + RETRY_EXCEPTIONS as e:
+                # the server is restarting, keep waiting for it
+                out.write("Polling stats failed, " + str(e) + ".\n")
+                out.flush()
+                interval = min(max_interval, interval * 2)
+                if not wait(interval):
+                    return False
+                continue
+            if stats is None:
+                transfer = self.last_transfer()
+                raise GraymetaHTTPError("stats returned nothing", transfer["status"] if transfer is not None else None)
+            jobs = stats.get("jobs") or {}
+            queue_depths = stats.get("queue_depths") or {}
+            running_jobs = jobs.get("running") or 0
+            pending_jobs = jobs.get("pending") or 0
+            if running_jobs + pending_jobs == 0:
+                out.write("Idle after " + str(int(time.time() - start)) + "s.\n")
+                return True
+
+            total = running_jobs + pending_jobs + sum(queue_depths.values())
+            if first_total is None:
+                first_total = total
+            elapsed = time.time() - start
+            if elapsed > 0 and total < first_total:
+                drain = str(int(total / ((first_total - total) / elapsed))) + "s"
+            else:
+                drain = "unknown"
+
+            deltas = []
+            for stage in sorted(queue_depths):
+                depth = queue_depths[stage]
+                if previous is None:
+                    deltas.append(stage + "=" + str(depth))
+                elif depth != previous.get(stage, 0):
+                    deltas.append(stage + "=" + str(depth) + " (" + ("%+d" % (depth - previous.get(stage, 0))) + ")")
+            out.write(" ".join(["running=" + str(running_jobs), "pending=" + str(pending_jobs)] + deltas + ["drain~" + drain]) + "\n")
+            out.flush()
+
+            # back off while nothing is moving
+            if previous is not None and queue_depths == previous:
+                interval = min(max_interval, interval * 2)
+            else:
+                interval = min_interval
+            previous = queue_depths
+            if not wait(interval):
+                return False
+
     def stats(self):
         """
 {
@@ -389,33 +783,63 @@ class GraymetaClient():
         return self.http_get("/api/data/summary/platform")
 
     def scroll(self):
-        return self.http_post("/api/data/scroll", {})
+        return self.http_post("/api/data/scroll", {}, idempotent=True)
+
+    def iter_search(self, data=None, page_size=1000):
+        """
+        Yields each entry of /api/data/search as it arrives, fetching page_size
+        results per request (using offset) so the whole catalogue is never held
+        in memory.  data is a SearchQuery or any extra search body, e.g. filters
+        or date ranges; its limit and offset are the total to fetch and where to start.
+        """
+        if isinstance(data, SearchQuery):
+            data = data.to_dict()
+        data = dict(data or {})
+        remaining = data.get("limit")
+        offset = data.get("offset") or 0
+        while remaining is None or remaining > 0:
+            data["limit"] = page_size if remaining is None else min(page_size, remaining)
+            data["offset"] = offset
+            response = self.http_post("/api/data/search", data, idempotent=True)
+            results = (response or {}).get("results") or []
+            for r in results:
+                yield r
+            if len(results) < data["limit"]:
+                break
+            offset += len(results)
+            if remaining is not None:
+                remaining -= len(results)
+
+    def iter_search_results(self, data=None, page_size=1000, keep_document=True):
+        """
+        iter_search as SearchResults
+        """
+        for r in self.iter_search(data, page_size):
+            yield SearchResult.from_entry(r, keep_document)
+
+    def search_query(self, query):
+        """
+        one /api/data/search request for a SearchQuery
+        """
+        return self.http_post("/api/data/search", query.to_dict(), idempotent=True)
 
     def search(self, limit=50000):
-        data = { "limit": limit }
-        return self.http_post("/api/data/search", data)
+        return self.search_query(SearchQuery(limit))
 
     def search_quick(self, limit=50000):
-        data = { "limit": limit, "only": [ "gm_item_id" ] }
-        return self.http_post("/api/data/search", data)
+        return self.search_query(SearchQuery(limit).only("gm_item_id"))
 
     def search_extracted(self, limit=50000):
-        filters = { "exists": [ { "field": "extracted", "value": True } ] }
-        data = { "limit": limit, "filters": filters }
-        return self.http_post("/api/data/search", data)
+        return self.search_query(SearchQuery(limit).exists("extracted"))
 
     def search_not_extracted(self, limit=50000):
-        filters = { "not_exists": [ { "field": "extracted", "value": True } ] }
-        data = { "limit": limit, "filters": filters }
-        return self.http_post("/api/data/search", data)
+        return self.search_query(SearchQuery(limit).not_exists("extracted"))
 
     def search_last_modified(self, date_from, date_to, limit=1000):
-        data = { "limit": limit, "last_modified": { "from": date_from, "to": date_to } }
-        return self.http_post("/api/data/search", data)
+        return self.search_query(SearchQuery(limit).last_modified(date_from, date_to))
 
     def search_last_harvested(self, date_from, date_to, limit=1000):
-        data = { "limit": limit, "last_harvested": { "from": date_from, "to": date_to } }
-        return self.http_post("/api/data/search", data)
+        return self.search_query(SearchQuery(limit).last_harvested(date_from, date_to))
 
     def compilations(self):
         return self.http_get("/api/data/summary/compilations")
@@ -431,11 +855,8 @@ class GraymetaClient():
         return self.http_post("/api/data/keyword-groups", data)
 
     def keyword_delete_group(self, group_id):
-        url = self.SERVER_URL + "/api/data/keyword-groups/" + group_id
-        headers = self.HEADERS
-        self._setupDebug()
-        r = requests.delete(url, headers=headers)
-        return r.json()
+        r = self._request("DELETE", "/api/data/keyword-groups/" + group_id)
+        return jsoncodec.loads(r.content)
 
     def keyword_add_to_group(self, group_id, word):
         url = "/api/data/keywords/" + group_id
@@ -443,48 +864,206 @@ class GraymetaClient():
         return self.http_post(url, data)
 
     def keyword_remove_from_group(self, group_id, word):
-        url = self.SERVER_URL + "/api/data/keywords/" + group_id + "?word=" +word
-        headers = self.HEADERS
-        self._setupDebug()
-        r = requests.delete(url, headers=headers)
-        return r.json()
+        r = self._request("DELETE", "/api/data/keywords/" + group_id + "?word=" +word)
+        return jsoncodec.loads(r.content)
+
+    def enable_singleflight(self, *endpoints):
+        """
+        GETs of these endpoint templates (as in metrics, e.g. /api/data/items/{id}
+        or /api/control/system/stats) made at the same time for the same url share
+        one request.  Everyone gets the same decoded object, so don't modify it.
+        """
+        self.singleflight_endpoints.update(endpoints)
+
+    def disable_singleflight(self, *endpoints):
+        self.singleflight_endpoints.difference_update(endpoints)
 
     def http_get(self, partial_url):
-        url = self.SERVER_URL + partial_url
-        headers = self.HEADERS
-        self._setupDebug()            
-        r = requests.get(url, headers=headers)
+        if self.singleflight_endpoints and endpoint_template(partial_url) in self.singleflight_endpoints:
+            return self.singleflight.do(partial_url, lambda: self._http_get(partial_url))
+        return self._http_get(partial_url)
+
+    def _http_get(self, partial_url):
+        r = self._request("GET", partial_url)
+        self._check_status(r, "GET", partial_url)
         if r.status_code >= 200 and r.status_code < 300:
-            return r.json()
+            return jsoncodec.loads(r.content)
         else:
             return None
 
-    def http_post(self, partial_url, data):
-        url = self.SERVER_URL + partial_url
-        headers = self.HEADERS
-        data_str = json.dumps(data)
-        self._setupDebug()            
-        r = requests.post(url, data=data_str, headers=headers)
-        return r.json()
+    def _check_status(self, r, method, partial_url):
+        if r.status_code >= 500 or r.status_code in RETRY_STATUSES:
+            # don't let an overloaded server look like a missing item
+            raise GraymetaHTTPError(method + " " + partial_url + " failed with " + str(r.status_code), r.status_code, r)
+
+    def get_raw(self, partial_url):
+        """
+        the undecoded body of a GET, None where http_get would return None
+        """
+        r = self._request("GET", partial_url)
+        self._check_status(r, "GET", partial_url)
+        if r.status_code >= 200 and r.status_code < 300:
+            return r.content
+        else:
+            return None
+
+    def download(self, partial_url, filename, chunk_size=1024 * 1024):
+        """
+        Streams a GET to filename a chunk at a time without decoding it, writing to a
+        temporary file which is renamed into place once complete.
+        Returns False where http_get would return None.
+        """
+        r = self._request("GET", partial_url, stream=True)
+        try:
+            self._check_status(r, "GET", partial_url)
+            if r.status_code < 200 or r.status_code >= 300:
+                return False
+            tmp_filename = filename + ".tmp"
+            bytes_received = 0
+            try:
+                with open(tmp_filename, "wb") as f:
+                    for chunk in r.iter_content(chunk_size):
+                        f.write(chunk)
+                        bytes_received += len(chunk)
+            except BaseException:
+                # don't leave half a file behind
+                if os.path.exists(tmp_filename):
+                    os.remove(tmp_filename)
+                raise
+            os.replace(tmp_filename, filename)
+            self._record_streamed(r, "GET", partial_url, bytes_received)
+            return True
+        finally:
+            r.close()
+
+    def http_post(self, partial_url, data, idempotent=False):
+        """
+        idempotent=True for posts that only read, like search, so they can be retried
+        """
+        r = self._request("POST", partial_url, idempotent=idempotent, data=jsoncodec.dumps_bytes(data))
+        return self._json(r, "POST", partial_url)
 
     def http_delete(self, partial_url, data=None):
-        url = self.SERVER_URL + partial_url
-        headers = self.HEADERS
         if data:
-            data_str = json.dumps(data)
+            data_str = jsoncodec.dumps_bytes(data)
         else:
             data_str = ""
+        r = self._request("DELETE", partial_url, data=data_str)
+        return self._json(r, "DELETE", partial_url)
 
-        self._setupDebug()            
-        r = requests.delete(url, data=data_str, headers=headers)
-        return r.json()
+    def _json(self, r, method, partial_url):
+        try:
+            return jsoncodec.loads(r.content)
+        except ValueError:
+            raise GraymetaHTTPError(method + " " + partial_url + " returned " + str(r.status_code) + " and no json", r.status_code, r)
 
-    def _setupDebug(self):
-        cli = CLI(sys.argv)
-        if cli.containsKey("-v") or cli.containsKey("-verbose"):
-            pass
+    def add_request_hook(self, pre=None, post=None):
+        """
+        pre(method, partial_url, kwargs) is called before every request and may change kwargs,
+        post(method, endpoint, partial_url, response, seconds) after it, response is None if it failed
+        """
+        if pre is not None:
+            self.pre_request_hooks.append(pre)
+        if post is not None:
+            self.post_request_hooks.append(post)
+
+    def _request(self, method, partial_url, idempotent=None, **kwargs):
+        """
+        every call to the server goes through here so it uses the pooled session,
+        the retry and concurrency controller and is counted in self.metrics.
+        idempotent defaults to True for GET and DELETE
+        """
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        self._setupDebug()
+        return self.controller.run(lambda: self._send(method, partial_url, kwargs), idempotent)
+
+    def _send(self, method, partial_url, kwargs):
+        """
+        one attempt at a request
+        """
+        url = self.SERVER_URL + partial_url
+        kwargs = dict(kwargs)
+        for hook in self.pre_request_hooks:
+            hook(method, partial_url, kwargs)
+
+        endpoint = endpoint_template(partial_url)
+        headers = self.HEADERS
+        if "headers" in kwargs:
+            # a pre hook's headers go on top of ours
+            headers = dict(self.HEADERS)
+            headers.update(kwargs.pop("headers") or {})
+        data = kwargs.get("data")
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+            kwargs["data"] = data
+        if isinstance(data, bytes):
+            bytes_sent = len(data)
+            if self.compress_requests and bytes_sent >= self.compress_min_size:
+                compressed = gzip.compress(data, 6)
+                if len(compressed) < bytes_sent:
+                    kwargs["data"] = compressed
+                    headers = dict(headers)
+                    headers["Content-Encoding"] = "gzip"
+            wire_bytes_sent = len(kwargs["data"])
         else:
+            bytes_sent = 0
+            wire_bytes_sent = 0
+        r = None
+        start = time.time()
+        try:
+            r = self.session.request(method, url, headers=headers, verify=self.SSL_VERIFY, timeout=self.TIMEOUT, **kwargs)
+            return r
+        finally:
+            seconds = time.time() - start
+            if r is None:
+                self.metrics.record(method, endpoint, None, seconds, bytes_sent, 0, wire_bytes_sent, 0)
+                self._local.transfer = None
+            else:
+                # a streamed body is not read yet, the caller records it with _record_streamed
+                if kwargs.get("stream"):
+                    bytes_received = 0
+                    wire_bytes_received = 0
+                else:
+                    bytes_received = len(r.content)
+                    wire_bytes_received = self._wire_bytes(r, bytes_received)
+                self.metrics.record(method, endpoint, r.status_code, seconds, bytes_sent, bytes_received, wire_bytes_sent, wire_bytes_received)
+                self._local.transfer = { "method": method, "endpoint": endpoint, "status": r.status_code,
+                    "content_encoding": r.headers.get("Content-Encoding"),
+                    "bytes_sent": bytes_sent, "wire_bytes_sent": wire_bytes_sent,
+                    "bytes_received": bytes_received, "wire_bytes_received": wire_bytes_received }
+            for hook in self.post_request_hooks:
+                hook(method, endpoint, partial_url, r, seconds)
+
+    def _wire_bytes(self, r, bytes_received):
+        # urllib3 counts the (compressed) bytes it read off the connection
+        try:
+            return r.raw.tell() or bytes_received
+        except (AttributeError, ValueError):
+            return bytes_received
+
+    def _record_streamed(self, r, method, partial_url, bytes_received):
+        wire_bytes_received = self._wire_bytes(r, bytes_received)
+        self.metrics.record_received(method, endpoint_template(partial_url), bytes_received, wire_bytes_received)
+        transfer = getattr(self._local, "transfer", None)
+        if transfer is not None:
+            transfer["bytes_received"] = bytes_received
+            transfer["wire_bytes_received"] = wire_bytes_received
+
+    def last_transfer(self):
+        """
+        the sizes of this thread's last request (the last attempt of it) as a dict of
+        method, endpoint, status, content_encoding, bytes_sent, bytes_received and the
+        wire_bytes_sent/wire_bytes_received that actually went over the connection
+        """
+        return getattr(self._local, "transfer", None)
+
+    def _setupDebug(self):
+        # -v turns on http logging, this only needs doing once
+        global _DEBUG_CONFIGURED
+        if not self.verbose or _DEBUG_CONFIGURED:
             return
+        _DEBUG_CONFIGURED = True
 
         import logging
         try:
@@ -0,0 +1,138 @@
+import sys
+import time
+from datetime import datetime
+from .checkpoint import CheckpointStore
+from .controller import GraymetaHTTPError, RETRY_STATUSES
+
+class HarvestScheduler():
+    """
+    Submits many harvest requests without flooding the pipeline.
+
+    Before each batch the server's stats() are checked: while jobs.running+pending
+    or any queue_depths stage is at its limit nothing is sent and the batch size is
+    halved, otherwise a batch is sent and the batch size grows again.  Submitted
+    jobs are recorded in progress_filename so an interrupted run can be resumed.
+    A job the server rejects as overloaded (429/502/503/504) is retried after halving
+    the batch size, up to max_retries times; one it rejects outright, or keeps
+    rejecting, is reported and left out of the progress file so a rerun tries it again.
+    The run stops with a GraymetaHTTPError if stats() returns nothing.
+
+    A job is a dict of location_id and container_id (harvests the container),
+    plus stow_url to harvest a single item; force, extractors, override_extractors
+    and new_extractors are optional.
+    """
+
+    def __init__(self, client, progress_filename=None, max_pending=100, max_queue_depth=1000, min_batch=1, max_batch=50, poll_interval=5, max_retries=5, out=None):
+        self.client = client
+        self.progress_filename = progress_filename
+        self.max_pending = max_pending
+        self.max_queue_depth = max_queue_depth
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.poll_interval = poll_interval
+        self.max_retries = max_retries
+        self.out = out or sys.stdout
+
+    def job_key(self, job):
+        return job["location_id"] + "/" + job["container_id"] + "/" + (job.get("stow_url") or "")
+
+    def submit(self, job):
+        force = job.get("force") or False
+        if job.get("stow_url"):
+            return self.client.harvest_item(job["location_id"], job["container_id"], job["stow_url"], None, force, job.get("extractors") or [], job.get("override_extractors") or False, job.get("new_extractors") or False)
+        else:
+            return self.client.harvest_container(job["location_id"], job["container_id"], force)
+
+    def status(self, job):
+        """
+        submits the job, returns the http status it got, None if it got none
+        """
+        try:
+            self.submit(job)
+        except GraymetaHTTPError as e:
+            # no json in the response
+            return e.status
+        transfer = self.client.last_transfer()
+        return transfer["status"] if transfer is not None else None
+
+    def capacity(self):
+        """
+        how many more jobs the server will take right now, 0 when it is saturated
+        """
+        stats = self.client.stats()
+        if stats is None:
+            # an expired key looks the same, don't flood the server with jobs
+            transfer = self.client.last_transfer()
+            raise GraymetaHTTPError("stats returned nothing, stopping the harvest", transfer["status"] if transfer is not None else None)
+        jobs = stats.get("jobs") or {}
+        load = (jobs.get("running") or 0) + (jobs.get("pending") or 0)
+        queue_depths = stats.get("queue_depths") or {}
+        deepest = max(list(queue_depths.values()) or [0])
+        if load >= self.max_pending or deepest >= self.max_queue_depth:
+            return 0
+        return self.max_pending - load
+
+    def run(self, jobs):
+        """
+        submits every job not already in the progress file, returns the number submitted
+        (jobs rejected outright are not)
+        """
+        progress = CheckpointStore(self.progress_filename) if self.progress_filename else set()
+        todo = [job for job in jobs if self.job_key(job) not in progress]
+        total = len(todo)
+        self.out.write("Harvesting " + str(total) + " jobs, " + str(len(progress)) + " already submitted.\n")
+
+        start_time = datetime.today()
+        submitted = 0
+        done = 0
+        retries = 0
+        batch_size = self.min_batch
+        try:
+            while done < total:
+                capacity = self.capacity()
+                if capacity == 0:
+                    batch_size = max(self.min_batch, batch_size // 2)
+                    self.out.write("Pipeline saturated, waiting " + str(self.poll_interval) + "s.\n")
+                    time.sleep(self.poll_interval)
+                    continue
+
+                overloaded = False
+                for job in todo[done:done + min(batch_size, capacity)]:
+                    status = self.status(job)
+                    if status in RETRY_STATUSES and retries < self.max_retries:
+                        overloaded = True
+                        retries += 1
+                        break
+                    done += 1
+                    retries = 0
+                    if status is None or status >= 400:
+                        self.out.write("Harvest of " + self.job_key(job) + " rejected with " + (str(status) if status is not None else "no status") + ".\n")
+                        continue
+                    progress.add(self.job_key(job))
+                    submitted += 1
+
+                if overloaded:
+                    # try the same job again, more gently
+                    batch_size = max(self.min_batch, batch_size // 2)
+                    self.out.write("Harvest rejected with " + str(status) + ", waiting " + str(self.poll_interval) + "s.\n")
+                    time.sleep(self.poll_interval)
+                    continue
+
+                # room to spare, so speed up
+                batch_size = min(self.max_batch, batch_size * 2)
+                self._report(submitted, total, start_time)
+                if done < total:
+                    time.sleep(self.poll_interval)
+        finally:
+            if self.progress_filename:
+                progress.close()
+        return submitted
+
+    def _report(self, submitted, total, start_time):
+        elapsed = (datetime.today() - start_time).total_seconds()
+        rate = submitted / elapsed if elapsed > 0 else 0
+        if rate > 0:
+            eta = str(int((total - submitted) / rate)) + "s"
+        else:
+            eta = "unknown"
+        self.out.write("Submitted " + str(submitted) + "/" + str(total) + " at " + ("%.2f" % rate) + " jobs/s, ETA " + eta + ".\n")
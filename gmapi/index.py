@@ -0,0 +1,189 @@
+"""
+A local SQLite index over extracted metadata so questions about the catalogue
+can be answered without going back to the server.
+
+    gm index build -output_dir extracted -db gm.db
+    gm index query -db gm.db -container my-bucket -text "some words"
+
+build reads both extract output formats (the _index.json/_v1.json files and
+-format archive shards) and skips anything already indexed and unchanged, so it
+can be rerun as new extracts land.
+"""
+import os
+import json
+import sqlite3
+from .archive import ArchiveReader, INDEX_FILENAME
+
+# enough of an item's text to search without storing whole documents twice
+MAX_TEXT_LENGTH = 1024 * 1024
+
+DATE_FIELDS = ("last_modified", "last_harvested")
+
+# 1: items_fts rows share their items row's rowid
+SCHEMA_VERSION = 1
+
+class MetadataIndex():
+
+    def __init__(self, db_filename):
+        self.db_filename = db_filename
+        self.db = sqlite3.connect(db_filename)
+        self.db.execute("CREATE TABLE IF NOT EXISTS items (id TEXT PRIMARY KEY, name TEXT, stow_url TEXT, container TEXT, last_modified TEXT, last_harvested TEXT, source TEXT, source_version TEXT)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS items_container ON items (container)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS items_last_modified ON items (last_modified)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS items_last_harvested ON items (last_harvested)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS items_source ON items (source)")
+        try:
+            self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(id UNINDEXED, name, stow_url, body)")
+            self.fts = True
+        except sqlite3.OperationalError:
+            # sqlite built without fts5, text queries fall back to LIKE on name and stow_url
+            self.fts = False
+        if self.db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            if self.fts:
+                # older items_fts rowids don't line up with items, index everything again
+                self.db.execute("DELETE FROM items_fts")
+                self.db.execute("UPDATE items SET source_version = NULL")
+            self.db.execute("PRAGMA user_version = " + str(SCHEMA_VERSION))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def build(self, output_dir, out=None):
+        """
+        indexes everything under output_dir, returns (indexed, skipped)
+        """
+        versions = dict(self.db.execute("SELECT source, source_version FROM items"))
+        indexed = 0
+        skipped = 0
+        for source, version, load in self._sources(output_dir):
+            if versions.get(source) == version:
+                skipped += 1
+                continue
+            result, gm_item = load()
+            self._upsert(result, gm_item, source, version)
+            indexed += 1
+            if indexed % 1000 == 0:
+                self.db.commit()
+                if out is not None:
+                    out.write("Indexed " + str(indexed) + " items.\n")
+        self.db.commit()
+        return indexed, skipped
+
+    def _sources(self, output_dir):
+        """
+        yields (source, version, load) for every extracted item, load() returns (index result, v1 item)
+        """
+        for dirpath, dirnames, filenames in os.walk(output_dir):
+            dirnames.sort()
+            if INDEX_FILENAME in filenames:
+                archive = ArchiveReader(dirpath)
+                for gm_item_id, entry in archive.index.items():
+                    source = os.path.join(dirpath, INDEX_FILENAME) + "#" + gm_item_id
+                    version = entry["shard"] + ":" + str(entry["offset"])
+                    yield source, version, self._archive_loader(archive, gm_item_id)
+            for filename in sorted(filenames):
+                if not filename.endswith("_index.json"):
+                    continue
+                index_filename = os.path.join(dirpath, filename)
+                v1_filename = index_filename[:-len("_index.json")] + "_v1.json"
+                version = str(os.path.getmtime(index_filename))
+                if os.path.isfile(v1_filename):
+                    version = version + ":" + str(os.path.getmtime(v1_filename))
+                yield index_filename, version, self._files_loader(index_filename, v1_filename)
+
+    def _archive_loader(self, archive, gm_item_id):
+        def load():
+            record = archive.read(gm_item_id)
+            return record["index"], record["v1"]
+        return load
+
+    def _files_loader(self, index_filename, v1_filename):
+        def load():
+            result = json.loads(open(index_filename, 'r').read())
+            gm_item = None
+            if os.path.isfile(v1_filename):
+                gm_item = json.loads(open(v1_filename, 'r').read())
+            return result, gm_item
+        return load
+
+    def _upsert(self, result, gm_item, source, version):
+        gm_item_id = result["_id"]
+        row = (gm_item_id, result.get("name"), result.get("stow_url"), result.get("stow_container_id"), result.get("last_modified"), result.get("last_harvested"), source, version)
+        # by rowid, a lookup on the unindexed id column would scan the whole fts table
+        old = self.db.execute("SELECT rowid FROM items WHERE id = ?", (gm_item_id,)).fetchone()
+        if old is not None and self.fts:
+            self.db.execute("DELETE FROM items_fts WHERE rowid = ?", old)
+        rowid = self.db.execute("INSERT OR REPLACE INTO items (id, name, stow_url, container, last_modified, last_harvested, source, source_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row).lastrowid
+        if self.fts:
+            body = _text(gm_item)[:MAX_TEXT_LENGTH] if gm_item is not None else ""
+            self.db.execute("INSERT INTO items_fts (rowid, id, name, stow_url, body) VALUES (?, ?, ?, ?, ?)", (rowid, gm_item_id, result.get("name"), result.get("stow_url"), body))
+
+    def query(self, stow_url=None, name=None, container=None, date_field="last_harvested", date_from=None, date_to=None, text=None, limit=100, fts_syntax=False):
+        """
+        items matching every given condition as dicts, newest first by date_field.
+        stow_url and name match substrings, text matches items whose metadata has every
+        word in it, or with fts_syntax=True is an fts5 query (raising sqlite3.OperationalError
+        if it doesn't parse).
+        """
+        if date_field not in DATE_FIELDS:
+            raise ValueError("date_field must be one of " + ", ".join(DATE_FIELDS))
+
+        where = []
+        params = []
+        if stow_url is not None:
+            where.append("items.stow_url LIKE ?")
+            params.append("%" + stow_url + "%")
+        if name is not None:
+            where.append("items.name LIKE ?")
+            params.append("%" + name + "%")
+        if container is not None:
+            where.append("items.container = ?")
+            params.append(container)
+        if date_from is not None:
+            where.append("items." + date_field + " >= ?")
+            params.append(date_from)
+        if date_to is not None:
+            where.append("items." + date_field + " <= ?")
+            params.append(date_to)
+        if text is not None:
+            if self.fts:
+                where.append("items.rowid IN (SELECT rowid FROM items_fts WHERE items_fts MATCH ?)")
+                params.append(text if fts_syntax else _phrases(text))
+            else:
+                where.append("(items.name LIKE ? OR items.stow_url LIKE ?)")
+                params.extend(["%" + text + "%", "%" + text + "%"])
+
+        sql = "SELECT id, name, stow_url, container, last_modified, last_harvested FROM items"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY " + date_field + " DESC LIMIT ?"
+        params.append(limit)
+
+        columns = ("_id", "name", "stow_url", "stow_container_id", "last_modified", "last_harvested")
+        return [dict(zip(columns, row)) for row in self.db.execute(sql, params)]
+
+
+def _phrases(text):
+    """
+    each word of text as an fts5 phrase, so punctuation like - or : is searched for
+    rather than read as query syntax
+    """
+    return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+def _text(document):
+    """
+    all the strings in a json document joined up for full text search
+    """
+    strings = []
+    stack = [document]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+        elif isinstance(value, str):
+            strings.append(value)
+    return " ".join(strings)
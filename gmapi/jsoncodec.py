@@ -0,0 +1,45 @@
+"""
+json encoding and decoding for gmapi, using orjson when it is installed
+(pip install gmapi[fast]) and the standard library otherwise.
+
+orjson only indents by 2 spaces, so indented output always comes from the
+standard library's indent=4, the same bytes whichever is installed.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def loads(data):
+    """
+    data may be str or bytes
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    return json.loads(data)
+
+def dumps_bytes(obj, indent=False):
+    """
+    utf-8 encoded json, compact unless indent
+    """
+    if orjson is not None and not indent:
+        return orjson.dumps(obj)
+    return dumps(obj, indent).encode("utf-8")
+
+def dumps(obj, indent=False):
+    if indent:
+        return json.dumps(obj, indent=4)
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"))
+
+def dump_file(obj, filename, indent=False):
+    """
+    writes the encoded bytes straight to filename
+    """
+    with open(filename, "wb") as f:
+        f.write(dumps_bytes(obj, indent))
@@ -0,0 +1,111 @@
+import json
+
+class _Reader():
+    """
+    A growing window over a text file that json values are decoded from one at a time
+    """
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size):
+        # drop what has been consumed before reading more
+        if self.pos > 0:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        data = self.f.read(size)
+        if data:
+            self.buf += data
+        else:
+            self.eof = True
+
+    def peek(self):
+        """
+        the next non-whitespace character, or None at the end of the file
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                return None
+            self._fill(self.chunk_size)
+
+    def expect(self, c):
+        if self.peek() != c:
+            raise ValueError("Expected '" + c + "' at character " + str(self.pos) + " of the buffer")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # a number running up to the end of the buffer may carry on in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self._fill(size)
+            size = size * 2
+
+
+def iter_results(f, chunk_size=1024 * 1024):
+    """
+    Yields each entry of the "results" array of a saved /api/data/search response
+    as it is read, so memory use does not grow with the size of the file.
+    A JSON Lines file of one entry per line (gm search -format jsonl) is read too.
+    """
+    reader = _Reader(f, chunk_size)
+    if reader.peek() != "{":
+        raise ValueError("Expected a search response or JSON Lines of search results")
+
+    reader.expect("{")
+    # the first object is either the response, whose "results" are streamed, or the first line
+    first = {}
+    if reader.peek() != "}":
+        while True:
+            key = reader.value()
+            reader.expect(":")
+            if key == "results" and reader.peek() == "[":
+                reader.expect("[")
+                while reader.peek() != "]":
+                    yield reader.value()
+                    if reader.peek() == ",":
+                        reader.pos += 1
+                reader.pos += 1
+                first[key] = None
+            else:
+                first[key] = reader.value()
+            if reader.peek() != ",":
+                break
+            reader.pos += 1
+    reader.expect("}")
+    if "results" in first:
+        return
+    if "result" not in first:
+        raise ValueError("Expected a search response with \"results\" or JSON Lines of {\"result\": ...}")
+
+    yield first
+    line = 1
+    while reader.peek() is not None:
+        entry = reader.value()
+        line += 1
+        if not isinstance(entry, dict) or "result" not in entry:
+            raise ValueError("Search result " + str(line) + " has no \"result\"")
+        yield entry
+
+
+def iter_results_file(filename, chunk_size=1024 * 1024):
+    with open(filename, "r") as f:
+        for r in iter_results(f, chunk_size):
+            yield r
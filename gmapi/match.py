@@ -0,0 +1,56 @@
+"""
+Compiled stow_url matching for gm extract, one pattern or a file of them checked
+in a single pass:
+
+    substring   the pattern appears anywhere in the stow_url (the default)
+    glob        the whole stow_url matches a shell pattern, e.g. *run0/*.mp4
+    regex       a regular expression found anywhere in the stow_url
+"""
+import re
+import fnmatch
+
+MODES = ["substring", "glob", "regex"]
+
+def read_patterns(filename):
+    """
+    one pattern per line, blank lines and lines starting with # are skipped
+    """
+    patterns = []
+    for line in open(filename, "r"):
+        line = line.rstrip("\r\n")
+        if line.strip() and not line.startswith("#"):
+            patterns.append(line)
+    return patterns
+
+def compile_matcher(patterns, mode="substring"):
+    """
+    a function of a string that is True when any of the patterns match it,
+    raises ValueError for an unknown mode or a regex that doesn't compile
+    """
+    if mode not in MODES:
+        raise ValueError("match mode must be one of " + ", ".join(MODES))
+    if not patterns:
+        return lambda value: False
+    if mode == "substring" and len(patterns) == 1:
+        term = patterns[0]
+        return lambda value: term in value
+    if mode == "substring":
+        regex = "|".join(re.escape(pattern) for pattern in patterns)
+        search = re.compile(regex).search
+    elif mode == "glob":
+        # fnmatch.translate anchors each pattern at the end, match anchors the start
+        regex = "|".join("(?:" + fnmatch.translate(pattern) + ")" for pattern in patterns)
+        search = re.compile(regex).match
+    else:
+        # compiled one by one, backreferences and inline flags can't be joined up
+        searches = [_compile_regex(pattern).search for pattern in patterns]
+        if len(searches) > 1:
+            return lambda value: any(search(value) is not None for search in searches)
+        search = searches[0]
+    return lambda value: search(value) is not None
+
+def _compile_regex(pattern):
+    try:
+        return re.compile(pattern)
+    except re.error as e:
+        raise ValueError("bad regex '" + pattern + "': " + str(e))
@@ -0,0 +1,68 @@
+import os
+import json
+import time
+import threading
+
+class MetadataCache():
+    """
+    A TTL cache for lookups that rarely change, such as locations and containers.
+    When a filename is given the entries are saved to it so separate `gm`
+    invocations can share them until they expire.
+    """
+
+    def __init__(self, ttl=300, filename=None):
+        self.ttl = ttl
+        self.filename = filename
+        self.entries = {}
+        self._lock = threading.Lock()
+        if filename and os.path.isfile(filename):
+            try:
+                self.entries = json.loads(open(filename, 'r').read())
+            except ValueError:
+                # a corrupt cache is just an empty one
+                self.entries = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self.entries[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self.entries[key] = [time.time() + self.ttl, value]
+            self._save()
+
+    def get_or_load(self, key, loader):
+        """
+        returns the cached value or calls loader() and caches what it returns (unless None)
+        """
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, key=None):
+        """
+        forgets one key, or everything when key is None
+        """
+        with self._lock:
+            if key is None:
+                self.entries = {}
+            else:
+                self.entries.pop(key, None)
+            self._save()
+
+    def _save(self):
+        if not self.filename:
+            return
+        tmp_filename = self.filename + ".tmp"
+        open(tmp_filename, 'w').write(json.dumps(self.entries))
+        os.replace(tmp_filename, self.filename)
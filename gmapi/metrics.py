@@ -0,0 +1,197 @@
+"""
+Request counters and latency histograms for GraymetaClient, per endpoint template
+(e.g. GET /api/data/items/{id}), exported as a json snapshot or Prometheus text.
+"""
+import json
+import threading
+
+# seconds, as Prometheus histogram upper bounds
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf")]
+
+# path segments followed by an id
+ID_PARENTS = set(["items", "comments", "keyword-groups", "keywords", "locations", "files"])
+
+def endpoint_template(partial_url):
+    """
+    /api/data/items/abc/captions?caption_id=1 -> /api/data/items/{id}/captions
+    """
+    path = partial_url.split("?")[0]
+    segments = path.split("/")
+    for i in range(1, len(segments)):
+        if segments[i - 1] in ID_PARENTS and segments[i]:
+            segments[i] = "{id}"
+    return "/".join(segments)
+
+
+class EndpointStats():
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        # as they went over the wire, i.e. compressed
+        self.wire_bytes_sent = 0
+        self.wire_bytes_received = 0
+        self.statuses = {}
+
+    def percentile(self, p):
+        """
+        the upper bound of the bucket holding the p'th percentile
+        """
+        if self.count == 0:
+            return 0.0
+        target = self.count * p / 100.0
+        for i, count in enumerate(self.buckets):
+            if count >= target:
+                return BUCKETS[i]
+        return BUCKETS[-1]
+
+
+class Metrics():
+
+    def __init__(self):
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, method, endpoint):
+        key = (method, endpoint)
+        stats = self.endpoints.get(key)
+        if stats is None:
+            stats = EndpointStats()
+            self.endpoints[key] = stats
+        return stats
+
+    def record(self, method, endpoint, status, seconds, bytes_sent=0, bytes_received=0, wire_bytes_sent=None, wire_bytes_received=None):
+        """
+        status is None when the request failed without a response.  bytes_* are the
+        uncompressed body sizes, wire_bytes_* what was sent (default the same)
+        """
+        with self._lock:
+            stats = self._stats(method, endpoint)
+            stats.count += 1
+            stats.seconds += seconds
+            for i, bound in enumerate(BUCKETS):
+                # cumulative, as prometheus expects
+                if seconds <= bound:
+                    stats.buckets[i] += 1
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+            stats.wire_bytes_sent += bytes_sent if wire_bytes_sent is None else wire_bytes_sent
+            stats.wire_bytes_received += bytes_received if wire_bytes_received is None else wire_bytes_received
+            status_key = str(status) if status is not None else "error"
+            stats.statuses[status_key] = stats.statuses.get(status_key, 0) + 1
+            if status is None or status >= 400:
+                stats.errors += 1
+
+    def record_received(self, method, endpoint, bytes_received, wire_bytes_received):
+        """
+        adds a streamed body, read after its request was recorded
+        """
+        with self._lock:
+            stats = self._stats(method, endpoint)
+            stats.bytes_received += bytes_received
+            stats.wire_bytes_received += wire_bytes_received
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = {}
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = []
+            for (method, endpoint), stats in sorted(self.endpoints.items()):
+                snapshot.append({
+                    "method": method,
+                    "endpoint": endpoint,
+                    "count": stats.count,
+                    "errors": stats.errors,
+                    "seconds_total": stats.seconds,
+                    "seconds_mean": stats.seconds / stats.count if stats.count else 0.0,
+                    "seconds_p50": stats.percentile(50),
+                    "seconds_p99": stats.percentile(99),
+                    "bytes_sent": stats.bytes_sent,
+                    "bytes_received": stats.bytes_received,
+                    "wire_bytes_sent": stats.wire_bytes_sent,
+                    "wire_bytes_received": stats.wire_bytes_received,
+                    "statuses": dict(stats.statuses),
+                })
+            return snapshot
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=4)
+
+    def to_prometheus(self):
+        with self._lock:
+            lines = []
+            lines.append("# TYPE gmapi_request_seconds histogram")
+            for (method, endpoint), stats in sorted(self.endpoints.items()):
+                labels = 'method="' + method + '",endpoint="' + endpoint + '"'
+                for i, bound in enumerate(BUCKETS):
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append("gmapi_request_seconds_bucket{" + labels + ',le="' + le + '"} ' + str(stats.buckets[i]))
+                lines.append("gmapi_request_seconds_sum{" + labels + "} " + repr(stats.seconds))
+                lines.append("gmapi_request_seconds_count{" + labels + "} " + str(stats.count))
+            lines.append("# TYPE gmapi_requests_total counter")
+            for (method, endpoint), stats in sorted(self.endpoints.items()):
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append('gmapi_requests_total{method="' + method + '",endpoint="' + endpoint + '",status="' + status + '"} ' + str(count))
+            lines.append("# TYPE gmapi_request_bytes_sent_total counter")
+            for (method, endpoint), stats in sorted(self.endpoints.items()):
+                lines.append('gmapi_request_bytes_sent_total{method="' + method + '",endpoint="' + endpoint + '"} ' + str(stats.bytes_sent))
+            lines.append("# TYPE gmapi_response_bytes_received_total counter")
+            for (method, endpoint), stats in sorted(self.endpoints.items()):
+                lines.append('gmapi_response_bytes_received_total{method="' + method + '",endpoint="' + endpoint + '"} ' + str(stats.bytes_received))
+            lines.append("# TYPE gmapi_request_wire_bytes_sent_total counter")
+            for (method, endpoint), stats in sorted(self.endpoints.items()):
+                lines.append('gmapi_request_wire_bytes_sent_total{method="' + method + '",endpoint="' + endpoint + '"} ' + str(stats.wire_bytes_sent))
+            lines.append("# TYPE gmapi_response_wire_bytes_received_total counter")
+            for (method, endpoint), stats in sorted(self.endpoints.items()):
+                lines.append('gmapi_response_wire_bytes_received_total{method="' + method + '",endpoint="' + endpoint + '"} ' + str(stats.wire_bytes_received))
+            return "\n".join(lines) + "\n"
+
+    def write(self, filename):
+        """
+        Prometheus text if filename ends in .prom, otherwise the json snapshot
+        """
+        if filename.endswith(".prom"):
+            content = self.to_prometheus()
+        else:
+            content = self.to_json()
+        open(filename, "w").write(content)
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        serves /metrics in Prometheus text (and /metrics.json) from a daemon thread,
+        only to this machine unless host says otherwise (e.g. 0.0.0.0)
+        """
+        try:
+            from http.server import HTTPServer, BaseHTTPRequestHandler
+        except ImportError:
+            from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/metrics.json":
+                    body = metrics.to_json().encode("utf-8")
+                    content_type = "application/json"
+                else:
+                    body = metrics.to_prometheus().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4"
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = HTTPServer((host, port), MetricsHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return server
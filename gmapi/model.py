@@ -0,0 +1,66 @@
+"""
+SearchResult keeps the handful of search result fields gmapi works with as
+attributes, with the rest of the result held as compact json bytes and only
+decoded when document is asked for.  A list of them is a fraction of the size of
+the search response's dicts.
+
+    for result in client.iter_search_results():
+        print(result.gm_item_id, result.execution_id, result.filename)
+"""
+from . import jsoncodec
+
+
+class SearchResult():
+
+    __slots__ = ("gm_item_id", "stow_url", "name", "stow_container_id", "last_modified", "last_harvested",
+        "filename", "execution_id", "raw", "_document")
+
+    def __init__(self, result, keep_document=True):
+        """
+        result is one search result (an entry's "result"), keep_document=False drops
+        everything but the fields below
+        """
+        self.gm_item_id = result["_id"]
+        self.stow_url = result.get("stow_url") or ""
+        self.name = result.get("name")
+        self.stow_container_id = result.get("stow_container_id")
+        self.last_modified = result.get("last_modified")
+        self.last_harvested = result.get("last_harvested")
+        # .../{execution}/{id}/{filename}
+        parts = self.stow_url.rsplit("/", 3)
+        self.filename = parts[-1]
+        self.execution_id = "/".join(parts[-3:-1])
+        self.raw = jsoncodec.dumps_bytes(result) if keep_document else None
+        self._document = None
+
+    @classmethod
+    def from_entry(cls, entry, keep_document=True):
+        """
+        from a search response entry, {"result": {...}}
+        """
+        return cls(entry["result"], keep_document)
+
+    @classmethod
+    def from_response(cls, response, keep_document=True):
+        """
+        a list of every result in a search response
+        """
+        return [cls(entry["result"], keep_document) for entry in (response or {}).get("results") or []]
+
+    @property
+    def harvested(self):
+        return self.name is not None
+
+    @property
+    def document(self):
+        """
+        the whole search result, decoded on first use
+        """
+        if self._document is None:
+            if self.raw is None:
+                raise ValueError(self.gm_item_id + " was loaded without its document")
+            self._document = jsoncodec.loads(self.raw)
+        return self._document
+
+    def __repr__(self):
+        return "SearchResult(" + self.gm_item_id + ", " + self.stow_url + ")"
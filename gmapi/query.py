@@ -0,0 +1,91 @@
+"""
+SearchQuery builds one /api/data/search request body out of filters, date
+ranges, an `only` projection and paging, which can be combined freely:
+
+    query = SearchQuery().not_exists("extracted").last_harvested(date_from, date_to).only("stow_url", "name")
+    client.search_query(query)
+    for entry in client.iter_search(query):
+        ...
+
+Every method returns the query so calls can be chained.
+"""
+
+
+class SearchQuery():
+
+    def __init__(self, limit=None, offset=None):
+        self._filters = {}
+        self._ranges = {}
+        self._only = []
+        self._query = None
+        self._limit = limit
+        self._offset = offset
+
+    def filter(self, kind, field, value=True):
+        """
+        adds { "field": field, "value": value } to filters[kind], e.g. kind "exists"
+        """
+        self._filters.setdefault(kind, []).append({ "field": field, "value": value })
+        return self
+
+    def exists(self, field, value=True):
+        return self.filter("exists", field, value)
+
+    def not_exists(self, field, value=True):
+        return self.filter("not_exists", field, value)
+
+    def query(self, text):
+        """
+        the server's own text search over each item
+        """
+        self._query = text
+        return self
+
+    def date_range(self, field, date_from, date_to):
+        self._ranges[field] = { "from": date_from, "to": date_to }
+        return self
+
+    def last_modified(self, date_from, date_to):
+        return self.date_range("last_modified", date_from, date_to)
+
+    def last_harvested(self, date_from, date_to):
+        return self.date_range("last_harvested", date_from, date_to)
+
+    def only(self, *fields):
+        """
+        the fields each result is returned with, the rest are never sent
+        """
+        for field in fields:
+            if field not in self._only:
+                self._only.append(field)
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def offset(self, offset):
+        self._offset = offset
+        return self
+
+    def to_dict(self):
+        """
+        the request body
+        """
+        data = {}
+        if self._limit is not None:
+            data["limit"] = self._limit
+        if self._offset is not None:
+            data["offset"] = self._offset
+        if self._query is not None:
+            data["query"] = self._query
+        if self._only:
+            data["only"] = list(self._only)
+        if self._filters:
+            data["filters"] = dict((kind, list(values)) for kind, values in self._filters.items())
+        for field, date_range in self._ranges.items():
+            data[field] = dict(date_range)
+        return data
+
+    def __repr__(self):
+        return "SearchQuery(" + repr(self.to_dict()) + ")"
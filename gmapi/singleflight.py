@@ -0,0 +1,55 @@
+"""
+Single flight: concurrent calls for the same key share one call of the function
+and its result (or exception) instead of each making their own.  Nothing is
+cached, the next call after it finishes runs the function again.
+"""
+import threading
+
+
+class _Call():
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight():
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        # calls answered by another thread's request
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """
+        fn() for the first caller with this key, the callers that arrive while it
+        runs wait for it and get the same object back
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
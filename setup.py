@@ -46,6 +46,8 @@ setup(
     extras_require={
         'dev': ['check-manifest'],
         'test': ['coverage'],
+        'async': ['aiohttp'],
+        'fast': ['orjson'],
     },
 
     entry_points={
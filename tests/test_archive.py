@@ -0,0 +1,69 @@
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+from gmapi import archive
+from gmapi.archive import ArchiveReader, ArchiveWriter
+
+
+def shards(archive_dir):
+    return sorted(f for f in os.listdir(archive_dir) if f.startswith("shard-"))
+
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def compressions(self):
+        yield "gzip"
+        if archive.zstandard is not None:
+            yield "zstd"
+
+    def test_round_trip(self):
+        for compression in self.compressions():
+            archive_dir = os.path.join(self.dir, compression)
+            with ArchiveWriter(archive_dir, compression=compression) as writer:
+                writer.write("item1", {"_id": "item1", "name": "café"}, {"v": 2}, {"_id": "item1"})
+                writer.write_raw("item2", b'{\n  "_id": "item2"\n}', b'{"text": "a\\nb"}', b'{"_id":"item2"}')
+            reader = ArchiveReader(archive_dir)
+            self.assertEqual(len(reader), 2)
+            self.assertIn("item2", reader)
+            self.assertNotIn("item3", reader)
+            self.assertIsNone(reader.read("item3"))
+            self.assertEqual(reader.read("item1"), {"_id": "item1", "v1": {"_id": "item1", "name": "café"}, "v2": {"v": 2}, "index": {"_id": "item1"}})
+            self.assertEqual(reader.read("item2"), {"_id": "item2", "v1": {"_id": "item2"}, "v2": {"text": "a\nb"}, "index": {"_id": "item2"}})
+            self.assertEqual([record["_id"] for record in reader], ["item1", "item2"])
+
+    def test_shards_rotate(self):
+        with ArchiveWriter(self.dir, shard_size=1, compression="gzip") as writer:
+            for i in range(3):
+                writer.write("item" + str(i), {}, {}, {})
+        self.assertEqual(shards(self.dir), ["shard-00000.jsonl.gz", "shard-00001.jsonl.gz", "shard-00002.jsonl.gz"])
+        self.assertEqual(ArchiveReader(self.dir).read("item2")["_id"], "item2")
+
+    def test_shard_is_a_normal_gzip_file(self):
+        with ArchiveWriter(self.dir, compression="gzip") as writer:
+            writer.write("item1", {}, {}, {})
+            writer.write("item2", {}, {}, {})
+        with gzip.open(os.path.join(self.dir, shards(self.dir)[0]), "rb") as f:
+            self.assertEqual(len(f.read().splitlines()), 2)
+
+    def test_rerun_appends_and_last_write_wins(self):
+        with ArchiveWriter(self.dir, compression="gzip") as writer:
+            writer.write("item1", {"run": 1}, {}, {})
+        with ArchiveWriter(self.dir, compression="gzip") as writer:
+            writer.write("item1", {"run": 2}, {}, {})
+            writer.write("item2", {"run": 2}, {}, {})
+        self.assertEqual(len(shards(self.dir)), 2)
+        reader = ArchiveReader(self.dir)
+        self.assertEqual(len(reader), 2)
+        self.assertEqual(reader.read("item1")["v1"], {"run": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
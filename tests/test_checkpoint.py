@@ -0,0 +1,55 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from gmapi.checkpoint import CheckpointStore
+
+
+class CheckpointStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "cache.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def content(self):
+        return open(self.filename, "r").read()
+
+    def test_add_and_reload(self):
+        with CheckpointStore(self.filename) as store:
+            store.add("a")
+            store.add("b")
+            store.add("a")
+        self.assertEqual(self.content(), "a\nb\n")
+        with CheckpointStore(self.filename) as store:
+            self.assertEqual(sorted(store), ["a", "b"])
+            self.assertTrue("a" in store)
+            self.assertFalse("c" in store)
+
+    def test_torn_last_line_is_dropped(self):
+        open(self.filename, "w").write("a\nb\nc-half")
+        with CheckpointStore(self.filename) as store:
+            self.assertEqual(sorted(store), ["a", "b"])
+            store.add("c")
+        self.assertEqual(self.content(), "a\nb\nc\n")
+
+    def test_old_json_list_is_converted(self):
+        open(self.filename, "w").write(json.dumps(["a", "b", "c"]))
+        with CheckpointStore(self.filename) as store:
+            self.assertEqual(len(store), 3)
+            store.add("d")
+        self.assertEqual(sorted(self.content().split()), ["a", "b", "c", "d"])
+        with CheckpointStore(self.filename) as store:
+            self.assertEqual(sorted(store), ["a", "b", "c", "d"])
+
+    def test_missing_file(self):
+        with CheckpointStore(self.filename, sync=False) as store:
+            self.assertEqual(len(store), 0)
+        self.assertTrue(os.path.isfile(self.filename))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import requests
+from gmapi import controller
+from gmapi.controller import RequestController
+
+
+class FakeResponse():
+
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class Sender():
+    """
+    send() for RequestController.run, returning or raising each outcome in turn
+    """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def __call__(self):
+        outcome = self.outcomes[min(self.calls, len(self.outcomes) - 1)]
+        self.calls += 1
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class RequestControllerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sleeps = []
+        self._sleep = controller.time.sleep
+        controller.time.sleep = self.sleeps.append
+
+    def tearDown(self):
+        controller.time.sleep = self._sleep
+
+    def test_slot_released_after_unexpected_exception(self):
+        c = RequestController(initial_limit=2, max_limit=2)
+        for i in range(3):
+            with self.assertRaises(requests.exceptions.ContentDecodingError):
+                c.run(Sender(requests.exceptions.ContentDecodingError("bad body")), True)
+            self.assertEqual(c.in_flight, 0)
+
+    def test_slot_released_after_hook_error(self):
+        c = RequestController(initial_limit=1, max_limit=1)
+        with self.assertRaises(KeyError):
+            c.run(Sender(KeyError("hook")), True)
+        self.assertEqual(c.in_flight, 0)
+        self.assertEqual(c.run(Sender(FakeResponse(200)), True).status_code, 200)
+
+    def test_chunked_encoding_error_is_retried(self):
+        c = RequestController(max_retries=3)
+        send = Sender(requests.exceptions.ChunkedEncodingError("cut short"), FakeResponse(200))
+        self.assertEqual(c.run(send, True).status_code, 200)
+        self.assertEqual(send.calls, 2)
+        self.assertEqual(c.retries, 1)
+        self.assertEqual(c.in_flight, 0)
+
+    def test_connection_error_raised_once_retries_run_out(self):
+        c = RequestController(max_retries=2)
+        send = Sender(requests.ConnectionError("down"))
+        with self.assertRaises(requests.ConnectionError):
+            c.run(send, True)
+        self.assertEqual(send.calls, 3)
+        self.assertEqual(c.in_flight, 0)
+
+    def test_retry_status_uses_retry_after(self):
+        c = RequestController(max_retries=3)
+        busy = FakeResponse(503, { "Retry-After": "7" })
+        send = Sender(busy, FakeResponse(200))
+        self.assertEqual(c.run(send, True).status_code, 200)
+        self.assertEqual(self.sleeps, [7.0])
+        self.assertTrue(busy.closed)
+
+    def test_last_retry_status_is_returned(self):
+        c = RequestController(max_retries=2)
+        send = Sender(FakeResponse(429))
+        self.assertEqual(c.run(send, True).status_code, 429)
+        self.assertEqual(send.calls, 3)
+
+    def test_not_idempotent_is_not_retried(self):
+        c = RequestController(max_retries=5)
+        send = Sender(FakeResponse(503), FakeResponse(200))
+        self.assertEqual(c.run(send, False).status_code, 503)
+        with self.assertRaises(requests.ConnectionError):
+            c.run(Sender(requests.ConnectionError("down"), FakeResponse(200)), False)
+        self.assertEqual(self.sleeps, [])
+
+    def test_backoff(self):
+        c = RequestController(backoff_base=0.5, backoff_max=10)
+        self.assertEqual(c.backoff(1, "120"), 10)
+        self.assertEqual(c.backoff(1, "2.5"), 2.5)
+        for attempt in range(1, 10):
+            delay = c.backoff(attempt, "Wed, 21 Oct 2015 07:28:00 GMT")
+            self.assertTrue(0 <= delay <= min(10, 0.5 * 2 ** attempt))
+
+    def test_limit_halves_on_error_and_grows_back(self):
+        c = RequestController(initial_limit=8, max_limit=8)
+        c.run(Sender(FakeResponse(503)), False)
+        self.assertEqual(c.limit, 4)
+        # +1/limit per good response, so about a limit's worth per step
+        for i in range(40):
+            c.run(Sender(FakeResponse(200)), True)
+        self.assertEqual(c.limit, 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+import requests
+from gmapi.gmapi import GraymetaClient
+from gmapi.model import SearchResult
+
+
+class CutResponse():
+    """
+    a streamed 200 whose body is cut short after the first chunk
+    """
+
+    status_code = 200
+    headers = {}
+
+    def iter_content(self, chunk_size):
+        yield b"{\"_id\": "
+        raise requests.exceptions.ChunkedEncodingError("connection broken")
+
+    def close(self):
+        pass
+
+
+class ExtractTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.gm = GraymetaClient("http://localhost", "key")
+        self.result = SearchResult({"_id": "item1", "name": "a.mov", "stow_url": "s3://bucket/exec/item1/a.mov"})
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_download_removes_partial_file(self):
+        self.gm._request = lambda method, partial_url, **kwargs: CutResponse()
+        filename = os.path.join(self.dir, "item1_v1.json")
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            self.gm.download("/api/data/items/item1", filename)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_pretty_fails_when_metadata_missing(self):
+        self.gm.get_gm_item = lambda gm_item_id: {"_id": gm_item_id}
+        self.gm.get_gm_item_v2 = lambda gm_item_id: None
+        for output_mode in ("pretty", "compact"):
+            self.assertEqual(self.gm._extract_result(self.result, self.dir, set(), output_mode=output_mode),
+                (None, "Failed to extract item1: metadata not found", True))
+        self.assertEqual(os.listdir(self.dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
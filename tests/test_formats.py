@@ -0,0 +1,80 @@
+import io
+import csv
+import json
+import unittest
+from gmapi.formats import field_value, write_results
+
+ENTRIES = [
+    {"result": {"_id": "item1", "name": "a.mov", "stow_container_id": "bucket", "stow_url": "s3://bucket/e/item1/a.mov",
+        "last_harvested": "2021-01-01", "last_modified": "2020-01-01", "location": {"name": "s3"}, "tags": ["x", "y"]}},
+    {"result": {"_id": "item2", "stow_url": "s3://bucket/e/item2/b,c.mov"}},
+]
+
+
+class Output(io.StringIO):
+
+    def __init__(self):
+        io.StringIO.__init__(self)
+        self.writes = 0
+
+    def write(self, s):
+        self.writes += 1
+        return io.StringIO.write(self, s)
+
+
+class WriteResultsTest(unittest.TestCase):
+
+    def test_field_value(self):
+        result = ENTRIES[0]["result"]
+        self.assertEqual(field_value(result, "location.name"), "s3")
+        self.assertIsNone(field_value(result, "location.name.first"))
+        self.assertIsNone(field_value(result, "missing"))
+
+    def test_jsonl(self):
+        out = io.StringIO()
+        self.assertEqual(write_results(iter(ENTRIES), "jsonl", out=out), 2)
+        self.assertEqual([json.loads(line) for line in out.getvalue().splitlines()], ENTRIES)
+
+    def test_jsonl_fields(self):
+        out = io.StringIO()
+        write_results(ENTRIES, "jsonl", ["_id", "location.name"], out=out)
+        self.assertEqual([json.loads(line) for line in out.getvalue().splitlines()],
+            [{"_id": "item1", "location.name": "s3"}, {"_id": "item2", "location.name": None}])
+
+    def test_csv(self):
+        out = io.StringIO()
+        self.assertEqual(write_results(ENTRIES, "csv", ["_id", "stow_url", "tags", "name"], out=out), 2)
+        self.assertEqual(list(csv.reader(io.StringIO(out.getvalue()))), [
+            ["_id", "stow_url", "tags", "name"],
+            ["item1", "s3://bucket/e/item1/a.mov", '["x","y"]', "a.mov"],
+            ["item2", "s3://bucket/e/item2/b,c.mov", "", ""]])
+
+    def test_tsv_default_fields(self):
+        out = io.StringIO()
+        write_results(ENTRIES, "tsv", out=out)
+        header, first, second = out.getvalue().splitlines()
+        self.assertEqual(header.split("\t"), ["_id", "last_harvested", "last_modified", "stow_container_id", "name", "stow_url"])
+        self.assertEqual(first.split("\t")[0], "item1")
+
+    def test_table(self):
+        out = io.StringIO()
+        write_results(ENTRIES, out=out)
+        header, first, second = out.getvalue().splitlines()
+        self.assertTrue(header.startswith("ItemID"))
+        self.assertIn("bucket/a.mov", first)
+        self.assertIn("<not harvested> ( s3://bucket/e/item2/b,c.mov )", second)
+
+    def test_nothing(self):
+        out = io.StringIO()
+        self.assertEqual(write_results([], "table", out=out), 0)
+        self.assertEqual(out.getvalue(), "")
+
+    def test_batched_writes(self):
+        out = Output()
+        write_results(ENTRIES * 5, "jsonl", out=out, batch_size=4)
+        self.assertEqual(out.writes, 3)
+        self.assertEqual(len(out.getvalue().splitlines()), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from gmapi import harvest
+from gmapi.checkpoint import CheckpointStore
+from gmapi.controller import GraymetaHTTPError
+from gmapi.harvest import HarvestScheduler
+
+
+class FakeClient():
+    """
+    answers harvest_container with each status in turn, stats() with an idle server
+    """
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.harvests = []
+        self.transfer = None
+        self.idle = {"jobs": {"running": 0, "pending": 0}, "queue_depths": {}}
+
+    def harvest_container(self, location_id, container_id, force=False):
+        status = self.statuses[min(len(self.harvests), len(self.statuses) - 1)]
+        self.harvests.append(container_id)
+        self.transfer = {"status": status}
+        if isinstance(status, GraymetaHTTPError):
+            raise status
+        return {}
+
+    def stats(self):
+        return self.idle
+
+    def last_transfer(self):
+        return self.transfer
+
+
+def job(container_id):
+    return {"location_id": "l", "container_id": container_id}
+
+
+class HarvestSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sleeps = []
+        self._sleep = harvest.time.sleep
+        harvest.time.sleep = self.sleeps.append
+        self.dir = tempfile.mkdtemp()
+        self.progress_filename = os.path.join(self.dir, "progress")
+
+    def tearDown(self):
+        harvest.time.sleep = self._sleep
+        shutil.rmtree(self.dir)
+
+    def scheduler(self, client, **kwargs):
+        return HarvestScheduler(client, progress_filename=self.progress_filename, poll_interval=0, out=io.StringIO(), **kwargs)
+
+    def progress(self):
+        store = CheckpointStore(self.progress_filename)
+        try:
+            return set(store)
+        finally:
+            store.close()
+
+    def test_retry_status_is_retried(self):
+        client = FakeClient(503, 200, 200)
+        self.assertEqual(self.scheduler(client).run([job("a"), job("b")]), 2)
+        self.assertEqual(client.harvests, ["a", "a", "b"])
+        self.assertEqual(self.progress(), {"l/a/", "l/b/"})
+
+    def test_server_error_is_rejected_not_retried(self):
+        client = FakeClient(500, 200)
+        self.assertEqual(self.scheduler(client).run([job("a"), job("b")]), 1)
+        self.assertEqual(client.harvests, ["a", "b"])
+        self.assertEqual(self.progress(), {"l/b/"})
+
+    def test_error_without_status_is_rejected_not_retried(self):
+        client = FakeClient(GraymetaHTTPError("no json"), 200)
+        self.assertEqual(self.scheduler(client).run([job("a"), job("b")]), 1)
+        self.assertEqual(client.harvests, ["a", "b"])
+        self.assertEqual(self.progress(), {"l/b/"})
+
+    def test_retries_are_capped(self):
+        client = FakeClient(429, 429, 429, 200)
+        scheduler = self.scheduler(client, max_retries=2)
+        self.assertEqual(scheduler.run([job("a"), job("b")]), 1)
+        self.assertEqual(client.harvests, ["a", "a", "a", "b"])
+        self.assertEqual(self.progress(), {"l/b/"})
+        self.assertIn("Harvest of l/a/ rejected with 429.", scheduler.out.getvalue())
+
+    def test_missing_stats_stops_the_run(self):
+        client = FakeClient(200)
+        client.idle = None
+        with self.assertRaises(GraymetaHTTPError):
+            self.scheduler(client).run([job("a")])
+        self.assertEqual(client.harvests, [])
+
+    def test_rerun_skips_submitted_jobs(self):
+        self.scheduler(FakeClient(200)).run([job("a")])
+        client = FakeClient(200)
+        self.assertEqual(self.scheduler(client).run([job("a"), job("b")]), 1)
+        self.assertEqual(client.harvests, ["b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from gmapi.archive import ArchiveWriter
+from gmapi.index import MetadataIndex
+
+
+def result(gm_item_id, name, last_harvested):
+    return {"_id": gm_item_id, "name": name, "stow_url": "s3://bucket/exec/" + gm_item_id + "/" + name,
+        "stow_container_id": "bucket", "last_modified": "2020-01-01T00:00:00Z", "last_harvested": last_harvested}
+
+
+class MetadataIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.dir, "extracted")
+        self.index = MetadataIndex(os.path.join(self.dir, "gm.db"))
+        if not self.index.fts:
+            self.skipTest("sqlite built without fts5")
+
+        item_dir = os.path.join(self.output_dir, "exec", "item1")
+        os.makedirs(item_dir)
+        with open(os.path.join(item_dir, "a.mov_index.json"), "w") as f:
+            json.dump(result("item1", "a.mov", "2021-01-01T00:00:00Z"), f)
+        with open(os.path.join(item_dir, "a.mov_v1.json"), "w") as f:
+            json.dump({"_id": "item1", "tags": ["red-car", "harbour"]}, f)
+
+        with ArchiveWriter(os.path.join(self.output_dir, "archive")) as archive:
+            archive.write("item2", {"_id": "item2", "transcript": "a blue car"}, {}, result("item2", "b.mov", "2022-01-01T00:00:00Z"))
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.dir)
+
+    def ids(self, **kwargs):
+        return [row["_id"] for row in self.index.query(**kwargs)]
+
+    def test_build_and_query(self):
+        self.assertEqual(self.index.build(self.output_dir), (2, 0))
+        self.assertEqual(self.ids(), ["item2", "item1"])
+        self.assertEqual(self.ids(container="bucket", date_from="2021-06-01"), ["item2"])
+        self.assertEqual(self.ids(name=".mov", date_field="last_modified"), ["item1", "item2"])
+        self.assertEqual(self.index.query(name="a.mov")[0]["stow_url"], "s3://bucket/exec/item1/a.mov")
+
+    def test_rebuild_skips_unchanged(self):
+        self.index.build(self.output_dir)
+        self.assertEqual(self.index.build(self.output_dir), (0, 2))
+        self.assertEqual(len(self.ids()), 2)
+
+    def test_text_is_words(self):
+        self.index.build(self.output_dir)
+        self.assertEqual(self.ids(text="car"), ["item2", "item1"])
+        self.assertEqual(self.ids(text="red-car"), ["item1"])
+        self.assertEqual(self.ids(text="car-red"), [])
+        self.assertEqual(self.ids(text="blue car"), ["item2"])
+        self.assertEqual(self.ids(text="NOT \"car"), [])
+
+    def test_fts_syntax(self):
+        self.index.build(self.output_dir)
+        self.assertEqual(self.ids(text="harb*", fts_syntax=True), ["item1"])
+        self.assertEqual(self.ids(text="harbour OR blue", fts_syntax=True), ["item2", "item1"])
+        with self.assertRaises(sqlite3.OperationalError):
+            self.index.query(text="red-car", fts_syntax=True)
+
+    def test_bad_date_field(self):
+        with self.assertRaises(ValueError):
+            self.index.query(date_field="created")
+
+
+if __name__ == "__main__":
+    unittest.main()
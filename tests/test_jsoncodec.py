@@ -0,0 +1,55 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from gmapi import jsoncodec
+
+DOCUMENT = {"_id": "item1", "name": "café.mov", "tags": ["a", "b"], "size": 12, "nested": {"ok": True, "none": None}}
+
+
+class JsonCodecTest(unittest.TestCase):
+    """
+    run with orjson if it is installed and always without it
+    """
+
+    def setUp(self):
+        self.orjson = jsoncodec.orjson
+
+    def tearDown(self):
+        jsoncodec.orjson = self.orjson
+
+    def codecs(self):
+        yield self.orjson
+        jsoncodec.orjson = None
+        yield None
+
+    def test_round_trip(self):
+        for codec in self.codecs():
+            for indent in (False, True):
+                self.assertEqual(jsoncodec.loads(jsoncodec.dumps(DOCUMENT, indent)), DOCUMENT)
+                self.assertEqual(jsoncodec.loads(jsoncodec.dumps_bytes(DOCUMENT, indent)), DOCUMENT)
+
+    def test_indent_is_the_standard_library(self):
+        for codec in self.codecs():
+            self.assertEqual(jsoncodec.dumps(DOCUMENT, indent=True), json.dumps(DOCUMENT, indent=4))
+            self.assertEqual(jsoncodec.dumps_bytes(DOCUMENT, indent=True), json.dumps(DOCUMENT, indent=4).encode("utf-8"))
+
+    def test_compact(self):
+        for codec in self.codecs():
+            self.assertNotIn(" ", jsoncodec.dumps({"a": [1, 2], "b": "c"}))
+
+    def test_dump_file(self):
+        dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(dir, "item.json")
+            for codec in self.codecs():
+                jsoncodec.dump_file(DOCUMENT, filename, indent=True)
+                with open(filename, "r", encoding="utf-8") as f:
+                    self.assertEqual(f.read(), json.dumps(DOCUMENT, indent=4))
+        finally:
+            shutil.rmtree(dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import io
+import json
+import unittest
+from gmapi.jsonstream import iter_results
+
+RESULTS = [{ "result": { "_id": "id" + str(i), "stow_url": "s3://bucket/exec/run/file" + str(i) + ".mp4", "name": "é \"" + "x" * i + "\"" } } for i in range(5)]
+
+
+class IterResultsTest(unittest.TestCase):
+
+    def results(self, text, chunk_size):
+        return list(iter_results(io.StringIO(text), chunk_size))
+
+    def test_search_response_at_small_chunk_sizes(self):
+        text = json.dumps({ "total": 5, "results": RESULTS, "aggregations": { "a": [1, { "b": "]}" }] } }, indent=2)
+        for chunk_size in (1, 2, 3, 5, 8, 64, 1024 * 1024):
+            self.assertEqual(self.results(text, chunk_size), RESULTS)
+
+    def test_results_key_in_any_position(self):
+        text = json.dumps({ "results": RESULTS, "total": 5 })
+        for chunk_size in (1, 7):
+            self.assertEqual(self.results(text, chunk_size), RESULTS)
+
+    def test_empty_results(self):
+        self.assertEqual(self.results('{"total": 0, "results": []}', 1), [])
+
+    def test_json_lines_at_small_chunk_sizes(self):
+        text = "\n".join(json.dumps(entry) for entry in RESULTS) + "\n"
+        for chunk_size in (1, 2, 3, 5, 8, 64, 1024 * 1024):
+            self.assertEqual(self.results(text, chunk_size), RESULTS)
+
+    def test_json_lines_with_result_not_first(self):
+        entries = [{ "score": i, "result": entry["result"] } for i, entry in enumerate(RESULTS)]
+        text = "\n".join(json.dumps(entry) for entry in entries)
+        for chunk_size in (1, 4):
+            self.assertEqual(self.results(text, chunk_size), entries)
+
+    def test_lines_without_result_are_an_error(self):
+        text = '{"_id": "id0", "name": "a"}\n{"_id": "id1", "name": "b"}\n'
+        with self.assertRaises(ValueError):
+            self.results(text, 4)
+        text = json.dumps(RESULTS[0]) + "\n" + '{"_id": "id1"}\n'
+        with self.assertRaises(ValueError):
+            self.results(text, 4)
+
+    def test_not_an_object_is_an_error(self):
+        with self.assertRaises(ValueError):
+            self.results("[1, 2]", 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
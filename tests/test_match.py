@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+from gmapi.match import compile_matcher, read_patterns
+
+URL = "s3://bucket/run01/exec/item1/clip.MP4"
+
+
+class CompileMatcherTest(unittest.TestCase):
+
+    def test_no_patterns(self):
+        self.assertFalse(compile_matcher([])(URL))
+
+    def test_substring(self):
+        self.assertTrue(compile_matcher(["run01"])(URL))
+        self.assertFalse(compile_matcher(["run02"])(URL))
+        self.assertTrue(compile_matcher(["run02", "clip."])(URL))
+        self.assertFalse(compile_matcher(["run.1", "(clip"])(URL))
+
+    def test_glob(self):
+        self.assertTrue(compile_matcher(["*run01/*.MP4"], "glob")(URL))
+        # the whole stow_url, not part of it
+        self.assertFalse(compile_matcher(["run01/*"], "glob")(URL))
+        self.assertTrue(compile_matcher(["*.mov", "s3://bucket/*"], "glob")(URL))
+
+    def test_regex(self):
+        self.assertTrue(compile_matcher([r"run\d+/"], "regex")(URL))
+        self.assertFalse(compile_matcher([r"run\d{3}/"], "regex")(URL))
+        self.assertTrue(compile_matcher([r"\.mov$", r"(?i)\.mp4$"], "regex")(URL))
+        # each pattern keeps its own groups
+        self.assertTrue(compile_matcher([r"(a)\1", r"(\w)\1/"], "regex")("s3://bucket/aa/x"))
+        self.assertTrue(compile_matcher([r"(x)\1", r"(b)\1"], "regex")("s3://bb/"))
+
+    def test_bad_mode(self):
+        with self.assertRaises(ValueError):
+            compile_matcher(["run01"], "fuzzy")
+
+    def test_bad_regex(self):
+        with self.assertRaises(ValueError):
+            compile_matcher(["run01", "(clip"], "regex")
+
+    def test_read_patterns(self):
+        dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(dir, "patterns.txt")
+            with open(filename, "w") as f:
+                f.write("# wanted runs\nrun01\n\n  \n run02 \r\n")
+            self.assertEqual(read_patterns(filename), ["run01", " run02 "])
+        finally:
+            shutil.rmtree(dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+from gmapi import metacache
+from gmapi.metacache import MetadataCache
+
+
+class Clock():
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class MetadataCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self._time = metacache.time.time
+        metacache.time.time = self.clock
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "cache.json")
+
+    def tearDown(self):
+        metacache.time.time = self._time
+        shutil.rmtree(self.dir)
+
+    def test_expires_after_ttl(self):
+        cache = MetadataCache(ttl=60)
+        cache.set("locations", ["a"])
+        self.clock.now += 60
+        self.assertEqual(cache.get("locations"), ["a"])
+        self.clock.now += 1
+        self.assertIsNone(cache.get("locations"))
+        self.assertNotIn("locations", cache.entries)
+
+    def test_get_or_load(self):
+        cache = MetadataCache(ttl=60)
+        loads = []
+        loader = lambda: loads.append(1) or {"id": "c1"}
+        self.assertEqual(cache.get_or_load("container", loader), {"id": "c1"})
+        self.assertEqual(cache.get_or_load("container", loader), {"id": "c1"})
+        self.assertEqual(len(loads), 1)
+        self.clock.now += 61
+        cache.get_or_load("container", loader)
+        self.assertEqual(len(loads), 2)
+
+    def test_none_is_not_cached(self):
+        cache = MetadataCache(ttl=60)
+        loads = []
+        loader = lambda: loads.append(1)
+        self.assertIsNone(cache.get_or_load("missing", loader))
+        self.assertIsNone(cache.get_or_load("missing", loader))
+        self.assertEqual(len(loads), 2)
+
+    def test_invalidate(self):
+        cache = MetadataCache(ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.invalidate("a")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), 2)
+        cache.invalidate()
+        self.assertIsNone(cache.get("b"))
+
+    def test_shared_through_file(self):
+        MetadataCache(ttl=60, filename=self.filename).set("locations", ["a"])
+        self.assertEqual(MetadataCache(ttl=60, filename=self.filename).get("locations"), ["a"])
+        self.clock.now += 61
+        self.assertIsNone(MetadataCache(ttl=60, filename=self.filename).get("locations"))
+
+    def test_corrupt_file_is_empty(self):
+        with open(self.filename, "w") as f:
+            f.write("{not json")
+        cache = MetadataCache(ttl=60, filename=self.filename)
+        self.assertIsNone(cache.get("locations"))
+        cache.set("locations", ["a"])
+        self.assertEqual(MetadataCache(ttl=60, filename=self.filename).get("locations"), ["a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import json
+import unittest
+from gmapi.metrics import Metrics, endpoint_template
+
+
+class EndpointTemplateTest(unittest.TestCase):
+
+    def test_ids_are_replaced(self):
+        self.assertEqual(endpoint_template("/api/data/items/abc123"), "/api/data/items/{id}")
+        self.assertEqual(endpoint_template("/api/data/items/abc/captions?caption_id=1"), "/api/data/items/{id}/captions")
+        self.assertEqual(endpoint_template("/api/data/items/abc/comments/c1"), "/api/data/items/{id}/comments/{id}")
+        self.assertEqual(endpoint_template("/files/abc/metadata2.json"), "/files/{id}/metadata2.json")
+        self.assertEqual(endpoint_template("/api/data/locations/l1/containers"), "/api/data/locations/{id}/containers")
+
+    def test_fixed_paths_are_kept(self):
+        self.assertEqual(endpoint_template("/api/data/search"), "/api/data/search")
+        self.assertEqual(endpoint_template("/api/data/items"), "/api/data/items")
+        self.assertEqual(endpoint_template("/api/data/items/"), "/api/data/items/")
+        self.assertEqual(endpoint_template("/api/control/system/stats?x=1"), "/api/control/system/stats")
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_record(self):
+        metrics = Metrics()
+        metrics.record("GET", "/api/data/items/{id}", 200, 0.02, bytes_received=100, wire_bytes_received=40)
+        metrics.record("GET", "/api/data/items/{id}", 404, 0.2)
+        metrics.record("GET", "/api/data/items/{id}", None, 3.0)
+        metrics.record_received("GET", "/api/data/items/{id}", 1000, 250)
+        [snapshot] = metrics.snapshot()
+        self.assertEqual(snapshot["count"], 3)
+        self.assertEqual(snapshot["errors"], 2)
+        self.assertEqual(snapshot["statuses"], {"200": 1, "404": 1, "error": 1})
+        self.assertEqual(snapshot["bytes_received"], 1100)
+        self.assertEqual(snapshot["wire_bytes_received"], 290)
+        self.assertEqual(snapshot["seconds_p50"], 0.25)
+        self.assertEqual(snapshot["seconds_p99"], 5.0)
+        self.assertAlmostEqual(snapshot["seconds_mean"], 3.22 / 3)
+
+    def test_prometheus(self):
+        metrics = Metrics()
+        metrics.record("POST", "/api/data/search", 200, 0.03, bytes_sent=10)
+        text = metrics.to_prometheus()
+        labels = 'method="POST",endpoint="/api/data/search"'
+        self.assertIn("gmapi_request_seconds_bucket{" + labels + ',le="0.025"} 0\n', text)
+        self.assertIn("gmapi_request_seconds_bucket{" + labels + ',le="0.05"} 1\n', text)
+        self.assertIn("gmapi_request_seconds_bucket{" + labels + ',le="+Inf"} 1\n', text)
+        self.assertIn("gmapi_requests_total{" + labels + ',status="200"} 1\n', text)
+        self.assertIn("gmapi_request_wire_bytes_sent_total{" + labels + "} 10\n", text)
+
+    def test_reset(self):
+        metrics = Metrics()
+        metrics.record("GET", "/api/data/search", 200, 0.01)
+        metrics.reset()
+        self.assertEqual(json.loads(metrics.to_json()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
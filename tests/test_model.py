@@ -0,0 +1,45 @@
+import unittest
+from gmapi.model import SearchResult
+
+RESULT = {"_id": "item1", "name": "a.mov", "stow_url": "s3://bucket/exec1/run/item1/a.mov", "stow_container_id": "bucket",
+    "last_modified": "2020-01-01", "last_harvested": "2021-01-01", "extra": {"big": [1, 2, 3]}}
+
+
+class SearchResultTest(unittest.TestCase):
+
+    def test_fields(self):
+        result = SearchResult(RESULT)
+        self.assertEqual(result.gm_item_id, "item1")
+        self.assertEqual(result.stow_container_id, "bucket")
+        self.assertEqual(result.filename, "a.mov")
+        self.assertEqual(result.execution_id, "run/item1")
+        self.assertTrue(result.harvested)
+        self.assertEqual(result.document, RESULT)
+
+    def test_not_harvested(self):
+        result = SearchResult({"_id": "item2"})
+        self.assertFalse(result.harvested)
+        self.assertEqual(result.stow_url, "")
+        self.assertIsNone(result.last_harvested)
+
+    def test_without_document(self):
+        result = SearchResult(RESULT, keep_document=False)
+        self.assertIsNone(result.raw)
+        self.assertEqual(result.name, "a.mov")
+        with self.assertRaises(ValueError):
+            result.document
+
+    def test_slots(self):
+        with self.assertRaises(AttributeError):
+            SearchResult(RESULT).other = 1
+
+    def test_from_response(self):
+        results = SearchResult.from_response({"results": [{"result": RESULT}, {"result": {"_id": "item2"}}]})
+        self.assertEqual([result.gm_item_id for result in results], ["item1", "item2"])
+        self.assertEqual(SearchResult.from_response(None), [])
+        self.assertEqual(SearchResult.from_response({"results": None}), [])
+        self.assertEqual(SearchResult.from_entry({"result": RESULT}).gm_item_id, "item1")
+
+
+if __name__ == "__main__":
+    unittest.main()
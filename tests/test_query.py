@@ -0,0 +1,68 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+from gmapi import code
+from gmapi.cli import CLI
+from gmapi.query import SearchQuery
+
+
+class SearchQueryTest(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual(SearchQuery().to_dict(), {})
+
+    def test_combined(self):
+        query = (SearchQuery(limit=10)
+            .not_exists("extracted")
+            .exists("name")
+            .last_modified("2020-01-01", "2020-12-31")
+            .last_harvested("2021-01-01", "2021-06-30")
+            .only("stow_url", "name", "stow_url")
+            .query("clip")
+            .offset(20))
+        self.assertEqual(query.to_dict(), {
+            "limit": 10,
+            "offset": 20,
+            "query": "clip",
+            "only": ["stow_url", "name"],
+            "filters": {
+                "not_exists": [{"field": "extracted", "value": True}],
+                "exists": [{"field": "name", "value": True}]},
+            "last_modified": {"from": "2020-01-01", "to": "2020-12-31"},
+            "last_harvested": {"from": "2021-01-01", "to": "2021-06-30"}})
+
+    def test_later_range_replaces_earlier(self):
+        query = SearchQuery().last_harvested("a", "b").last_harvested("c", "d")
+        self.assertEqual(query.to_dict(), {"last_harvested": {"from": "c", "to": "d"}})
+
+    def test_to_dict_is_a_copy(self):
+        query = SearchQuery().exists("extracted").last_modified("a", "b")
+        data = query.to_dict()
+        data["filters"]["exists"].append({})
+        data["last_modified"]["from"] = "z"
+        self.assertEqual(query.to_dict(), {"filters": {"exists": [{"field": "extracted", "value": True}]}, "last_modified": {"from": "a", "to": "b"}})
+
+
+class SearchCommandTest(unittest.TestCase):
+
+    class Client():
+
+        def search_query(self, query):
+            self.query = query
+            return {"results": []}
+
+    def test_both_date_ranges(self):
+        gm = self.Client()
+        cli = CLI(["gm", "search", "-json",
+            "-last_modified_from", "2020-01-01", "-last_modified_to", "2020-12-31",
+            "-last_harvested_from", "2021-01-01", "-last_harvested_to", "2021-06-30"])
+        with redirect_stdout(io.StringIO()):
+            code.search(gm, cli)
+        data = gm.query.to_dict()
+        self.assertEqual(data["last_modified"], {"from": "2020-01-01", "to": "2020-12-31"})
+        self.assertEqual(data["last_harvested"], {"from": "2021-01-01", "to": "2021-06-30"})
+        self.assertEqual(data["limit"], 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
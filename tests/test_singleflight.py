@@ -0,0 +1,108 @@
+import time
+import threading
+import unittest
+from gmapi.singleflight import SingleFlight
+
+
+class Blocked():
+    """
+    a function that waits to be released, counting its calls
+    """
+
+    def __init__(self, result=None, error=None):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.result = result
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def run_concurrently(self, flight, key, fn, n):
+        """
+        starts a leader and n - 1 followers, returns the threads and what each got
+        """
+        outcomes = []
+        lock = threading.Lock()
+
+        def call():
+            try:
+                outcome = flight.do(key, fn)
+            except Exception as e:
+                outcome = e
+            with lock:
+                outcomes.append(outcome)
+
+        threads = [threading.Thread(target=call)]
+        threads[0].start()
+        fn.started.wait(5)
+        for i in range(n - 1):
+            thread = threading.Thread(target=call)
+            thread.start()
+            threads.append(thread)
+        return threads, outcomes
+
+    def wait_for_followers(self, flight, n):
+        for i in range(500):
+            if flight.coalesced == n:
+                return
+            time.sleep(0.01)
+        self.fail("followers never arrived")
+
+    def test_concurrent_calls_share_one(self):
+        flight = SingleFlight()
+        result = {"_id": "item1"}
+        fn = Blocked(result)
+        threads, outcomes = self.run_concurrently(flight, "/api/data/items/item1", fn, 4)
+        self.wait_for_followers(flight, 3)
+        fn.release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(fn.calls, 1)
+        self.assertEqual(len(outcomes), 4)
+        for outcome in outcomes:
+            self.assertIs(outcome, result)
+
+    def test_error_is_shared(self):
+        flight = SingleFlight()
+        fn = Blocked(error=KeyError("boom"))
+        threads, outcomes = self.run_concurrently(flight, "key", fn, 3)
+        self.wait_for_followers(flight, 2)
+        fn.release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(fn.calls, 1)
+        self.assertEqual([type(outcome) for outcome in outcomes], [KeyError] * 3)
+
+    def test_nothing_is_cached(self):
+        flight = SingleFlight()
+        calls = []
+        self.assertEqual(flight.do("key", lambda: calls.append(1) or len(calls)), 1)
+        self.assertEqual(flight.do("key", lambda: calls.append(1) or len(calls)), 2)
+        self.assertEqual(flight.coalesced, 0)
+        with self.assertRaises(ValueError):
+            flight.do("key", lambda: int("x"))
+        self.assertEqual(flight.do("key", lambda: "again"), "again")
+
+    def test_keys_are_separate(self):
+        flight = SingleFlight()
+        fn = Blocked("a")
+        threads, outcomes = self.run_concurrently(flight, "a", fn, 1)
+        self.assertEqual(flight.do("b", lambda: "b"), "b")
+        fn.release.set()
+        threads[0].join(5)
+        self.assertEqual(outcomes, ["a"])
+        self.assertEqual(flight.coalesced, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
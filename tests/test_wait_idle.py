@@ -0,0 +1,61 @@
+import io
+import unittest
+import requests
+from gmapi import gmapi
+from gmapi.controller import GraymetaHTTPError
+from gmapi.gmapi import GraymetaClient
+
+
+class Stats():
+    """
+    stats() for wait_until_idle, returning or raising each outcome in turn
+    """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def __call__(self):
+        outcome = self.outcomes[min(self.calls, len(self.outcomes) - 1)]
+        self.calls += 1
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class WaitUntilIdleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sleeps = []
+        self._sleep = gmapi.time.sleep
+        gmapi.time.sleep = self.sleeps.append
+        self.gm = GraymetaClient("http://localhost", "key")
+        self.out = io.StringIO()
+
+    def tearDown(self):
+        gmapi.time.sleep = self._sleep
+
+    def test_idle(self):
+        self.gm.stats = Stats({"jobs": {"running": 1}, "queue_depths": {"index": 3}}, {"jobs": {}, "queue_depths": {}})
+        self.assertTrue(self.gm.wait_until_idle(out=self.out))
+        self.assertEqual(self.gm.stats.calls, 2)
+
+    def test_errors_are_logged_and_polling_continues(self):
+        self.gm.stats = Stats(requests.ConnectionError("refused"), GraymetaHTTPError("failed with 503", 503), {"jobs": {}})
+        self.assertTrue(self.gm.wait_until_idle(out=self.out))
+        self.assertIn("Polling stats failed, refused.", self.out.getvalue())
+        self.assertIn("Polling stats failed, failed with 503.", self.out.getvalue())
+
+    def test_errors_until_timeout(self):
+        self.gm.stats = Stats(requests.ConnectionError("refused"))
+        self.assertFalse(self.gm.wait_until_idle(timeout=0, out=self.out))
+        self.assertIn("Timed out", self.out.getvalue())
+
+    def test_missing_stats_is_an_error(self):
+        self.gm.stats = Stats(None)
+        with self.assertRaises(GraymetaHTTPError):
+            self.gm.wait_until_idle(out=self.out)
+
+
+if __name__ == "__main__":
+    unittest.main()